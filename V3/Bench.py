@@ -0,0 +1,474 @@
+# Benchmarks of the assembler steps
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# Import needed functions to file reading and kmers extraction
+from Script import *
+
+# Import needed methods to create the DeBruijn graph
+from DBG import *
+
+
+def bench_threads(reads_file: str, k: int, threads_list: List[int]) -> List[Dict]:
+    """
+    Measures the kmers counting time for several numbers of processes and checks that the
+    counts are identical to the ones of the serial count.
+
+    Parameters:
+    reads_file: The reads file to count
+    k: The size of the kmers
+    threads_list: The numbers of processes to try
+
+    Returns:
+    A list of dictionaries (threads, seconds, speedup, identical) for each number of processes
+    """
+    start = perf_counter()
+    reference = count_reads_kmers(reads_file, k)
+    serial_time = perf_counter() - start
+
+    results = [{"threads": 1, "seconds": serial_time, "speedup": 1.0, "identical": True}]
+    for threads in threads_list:
+        if threads <= 1:
+            continue
+        start = perf_counter()
+        kmers_dict = count_reads_kmers(reads_file, k, threads)
+        elapsed = perf_counter() - start
+        results.append({"threads": threads, "seconds": elapsed, "speedup": serial_time / elapsed,
+                        "identical": kmers_dict == reference})
+    return results
+
+
+def bench_parse(reads_file: str) -> List[Dict]:
+    """
+    Measures the reading speed of the native parser (read_gz) against Biopython (read_records),
+    the sequences being converted to bytes as the assembler needs them.
+
+    Parameter:
+    reads_file: The reads file to parse
+
+    Returns:
+    A list of dictionaries (parser, reads, seconds, reads_per_sec, speedup) for each parser
+    """
+    parsers = [("native", lambda: read_gz(reads_file)),
+               ("biopython", lambda: (str(record.seq).encode() for record in read_records(reads_file)))]
+    results = []
+    for name, parse in parsers:
+        start = perf_counter()
+        reads = sum(1 for _ in parse())
+        elapsed = perf_counter() - start
+        results.append({"parser": name, "reads": reads, "seconds": elapsed, "reads_per_sec": reads / elapsed})
+    for result in results:
+        result["speedup"] = results[-1]["seconds"] / result["seconds"]
+    return results
+
+
+def bench_tips(reads_files: List[str], k: int, filter_threshold: int, tip_thresholds: List[int]) -> List[Dict]:
+    """
+    Measures the tips detection time on the graph of each reads file for several tip thresholds.
+
+    Parameters:
+    reads_files: The reads files whose graphs are built
+    k: The size of the kmers
+    filter_threshold: The minimal abundance of the kmers kept in the graphs
+    tip_thresholds: The tip thresholds to try
+
+    Returns:
+    A list of dictionaries (reads_file, kmers, threshold, edges, seconds) for each file and threshold
+    """
+    results = []
+    for reads_file in reads_files:
+        kmers_dict = kmers_filter(count_reads_kmers(reads_file, k), filter_threshold)
+        dbg = DBG(kmers_dict, k)
+        for threshold in tip_thresholds:
+            start = perf_counter()
+            edges = dbg.find_tip_edges(threshold)
+            elapsed = perf_counter() - start
+            results.append({"reads_file": reads_file, "kmers": len(kmers_dict), "threshold": threshold,
+                            "edges": len(edges), "seconds": elapsed})
+    return results
+
+
+# Stages of the assembly timed by bench_pipeline, in the order of Main.py
+PIPELINE_STAGES = ("count", "filter", "graph", "simplify", "extract")
+# Columns identifying a run of bench_pipeline, and columns compared with the baseline
+_PIPELINE_KEYS = ("reads_file", "k", "kf", "tt")
+_PIPELINE_METRICS = PIPELINE_STAGES + ("total", "peak_rss_mb")
+
+
+def _pipeline_run(reads_file: str, k: int, filter_threshold: int, tip_threshold: int) -> Dict:
+    """
+    Process of bench_pipeline: assembles a reads file as Main.py does (-a) and measures the wall
+    time of each stage and the peak resident memory of the process.
+    """
+    stages = {}
+    start = perf_counter()
+    kmers_dict = count_reads_kmers(reads_file, k)
+    stages["count"] = perf_counter() - start
+
+    start = perf_counter()
+    if filter_threshold > 1:
+        kmers_dict = kmers_filter(kmers_dict, filter_threshold)
+    stages["filter"] = perf_counter() - start
+
+    start = perf_counter()
+    dbg = DBG(kmers_dict, k)
+    stages["graph"] = perf_counter() - start
+
+    start = perf_counter()
+    dbg.simplify(tip_threshold=tip_threshold)
+    stages["simplify"] = perf_counter() - start
+
+    # Contigs are extracted while they are written
+    start = perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        contigs = write_fasta(os.path.join(directory, "contigs.fa"),
+                              ((contig.id, contig.sequence) for contig in dbg.iter_contigs()), 1)
+    stages["extract"] = perf_counter() - start
+
+    # ru_maxrss is given in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"reads_file": os.path.basename(reads_file), "k": k, "kf": filter_threshold, "tt": tip_threshold,
+            "kmers": len(kmers_dict), "contigs": contigs, **stages, "total": sum(stages.values()),
+            "peak_rss_mb": peak_rss}
+
+
+def bench_pipeline(reads_files: List[str], k_list: List[int], filter_thresholds: List[int],
+                   tip_thresholds: List[int], repeats: int = 1) -> List[Dict]:
+    """
+    Assembles each reads file for every combination of k, filter threshold and tip threshold,
+    each run in a new process so that its peak memory is its own.
+
+    Parameters:
+    reads_files: The reads files to assemble
+    k_list: The sizes of the kmers to try
+    filter_thresholds: The minimal abundances of the kmers kept in the graph to try
+    tip_thresholds: The tip thresholds to try
+    repeats: The number of runs of each combination, the fastest one being kept
+
+    Returns:
+    A list of dictionaries (reads_file, k, kf, tt, kmers, contigs, seconds of each stage of
+    PIPELINE_STAGES, total, peak_rss_mb) for each combination
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for reads_file in reads_files:
+        for k in k_list:
+            for filter_threshold in filter_thresholds:
+                for tip_threshold in tip_thresholds:
+                    runs = []
+                    for _ in range(repeats):
+                        with context.Pool(1) as pool:
+                            runs.append(pool.apply(_pipeline_run, (reads_file, k, filter_threshold, tip_threshold)))
+                    results.append(min(runs, key=lambda run: run["total"]))
+    return results
+
+
+def compare_baseline(results: List[Dict], baseline: List[Dict], tolerance: float = 0.1,
+                     min_seconds: float = 0.05, keys: Tuple[str, ...] = _PIPELINE_KEYS,
+                     metrics: Tuple[str, ...] = _PIPELINE_METRICS) -> int:
+    """
+    Compares benchmark results with the ones of a baseline run of the same benchmark: a metric
+    (stage time, total time or peak memory) regresses when it is more than tolerance (relative)
+    above the baseline. Times differing by less than min_seconds are ignored as noise. Each result
+    is given a "regressions" entry listing its regressed metrics ("new" if it is not in the baseline).
+
+    Parameters:
+    results: The results of bench_pipeline (or bench_micro)
+    baseline: The results of a previous run of the same benchmark
+    tolerance: The relative increase above which a metric regresses
+    min_seconds: The minimal increase of a time for it to regress
+    keys: The columns identifying a run
+    metrics: The columns compared (peak_rss_mb is a memory, the other ones are times)
+
+    Returns:
+    The number of regressed metrics
+
+    Example:
+    >>> baseline = [{"reads_file": "L1", "k": 21, "kf": 1, "tt": 3, "graph": 1.0, "total": 2.0, "peak_rss_mb": 80.0}]
+    >>> results = [{"reads_file": "L1", "k": 21, "kf": 1, "tt": 3, "graph": 1.5, "total": 2.02, "peak_rss_mb": 95.0},
+    ...            {"reads_file": "L2", "k": 21, "kf": 1, "tt": 3, "graph": 1.0, "total": 2.0, "peak_rss_mb": 80.0}]
+    >>> compare_baseline(results, baseline)
+    2
+    >>> [result["regressions"] for result in results]
+    ['graph +50%, peak_rss_mb +19%', 'new']
+    """
+    references = {tuple(run[key] for key in keys): run for run in baseline}
+    regressions = 0
+    for result in results:
+        reference = references.get(tuple(result[key] for key in keys))
+        if reference is None:
+            result["regressions"] = "new"
+            continue
+        flagged = []
+        for metric in metrics:
+            if metric not in result or metric not in reference:
+                continue
+            new, old = result[metric], reference[metric]
+            if metric != "peak_rss_mb" and new - old < min_seconds:
+                continue
+            if new > old * (1 + tolerance):
+                flagged.append(f"{metric} +{100 * (new - old) / old:.0f}%" if old else f"{metric} +{new:.3f}")
+        regressions += len(flagged)
+        result["regressions"] = ", ".join(flagged) or "-"
+    return regressions
+
+
+def _synthetic_genome(size: int, rng: random.Random) -> str:
+    return "".join(rng.choices(NUCLEOTIDES, k=size))
+
+
+def _synthetic_kmers(genome: str, k: int, rng: random.Random, spacing: int = 500) -> Dict[int, int]:
+    """
+    Returns the packed kmers of a genome (count 10) with sequencing errors every spacing bases
+    (count 1), alternately at the end of a read (a tip of 3 kmers) and inside a read (a bubble of
+    k kmers).
+    """
+    kmers_dict = dict.fromkeys(packed_kmers(genome, k), 10)
+    for i, position in enumerate(range(k, len(genome) - k, spacing)):
+        error = rng.choice([base for base in NUCLEOTIDES if base != genome[position]])
+        if i % 2:
+            branch = genome[position - k + 1:position] + error + _synthetic_genome(2, rng)
+        else:
+            branch = genome[position - k + 1:position] + error + genome[position + 1:position + k]
+        for kmer in packed_kmers(branch, k):
+            kmers_dict.setdefault(kmer, 1)
+    return kmers_dict
+
+
+def _micro_cases(k: int, directory: str) -> Dict[str, Tuple[Callable, Callable]]:
+    """
+    Returns the benchmarks of bench_micro: for each one, a function preparing its input from a
+    genome (not timed) and the timed function, called with this input.
+    """
+    def write_input(genome: str, rng: random.Random) -> List[Tuple[str, str]]:
+        return [(f"contig_{i}", genome[i:i + 1000]) for i in range(0, len(genome), 1000)]
+
+    def path_input(genome: str, rng: random.Random) -> Tuple[DBG, int]:
+        # A random genome has no repeat: its graph is a single simple path, walked from its middle
+        dbg = DBG(packed_kmers(genome, k), k)
+        middle = len(genome) // 2
+        return dbg, dbg._DBG__node_id(genome[middle:middle + k - 1])
+
+    return {
+        "kmers": (lambda genome, rng: genome, lambda genome: kmers(genome, k)),
+        "kmers_filter": (lambda genome, rng: _synthetic_kmers(genome, k, rng),
+                         lambda kmers_dict: kmers_filter(kmers_dict, 2)),
+        "dbg_build": (lambda genome, rng: _synthetic_kmers(genome, k, rng),
+                      lambda kmers_dict: DBG(kmers_dict, k)),
+        "simple_path": (path_input, lambda graph: graph[0]._DBG__simple_path(graph[1])),
+        "find_all_tips": (lambda genome, rng: DBG(_synthetic_kmers(genome, k, rng), k),
+                          lambda dbg: dbg.find_all_tips(10)),
+        "remove_bubbles": (lambda genome, rng: DBG(_synthetic_kmers(genome, k, rng), k),
+                           lambda dbg: dbg.remove_bubbles()),
+        "write_fasta": (write_input,
+                        lambda records: write_fasta(os.path.join(directory, "contigs.fa"), records, 1)),
+    }
+
+
+MICRO_BENCHMARKS = ("kmers", "kmers_filter", "dbg_build", "simple_path", "find_all_tips", "remove_bubbles",
+                    "write_fasta")
+
+
+def fit_scaling(sizes: List[int], seconds: List[float]) -> float:
+    """
+    Fits seconds = a * size^exponent by least squares on a log-log scale.
+
+    Parameters:
+    sizes: The sizes of the inputs
+    seconds: The times measured for each size
+
+    Returns:
+    The exponent: 1 for a linear time, 2 for a quadratic one
+
+    Example:
+    >>> round(fit_scaling([1000, 10000, 100000], [0.002, 0.2, 20.0]), 2)
+    2.0
+    """
+    if len(sizes) < 2:
+        return float("nan")
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+
+
+def bench_micro(sizes: List[int], k: int = 31, benchmarks: Tuple[str, ...] = MICRO_BENCHMARKS,
+                repeats: int = 3, seed: int = 0) -> List[Dict]:
+    """
+    Times the hot paths of the assembler alone on synthetic inputs of each size: a random genome of
+    size bases (the same one for a given seed) with a tip and a bubble every 500 bases. The input
+    of each run is prepared again, so that the functions editing the graph start from the same state.
+
+    Parameters:
+    sizes: The sizes of the genomes (in bases)
+    k: The size of the kmers
+    benchmarks: The benchmarks to run, among MICRO_BENCHMARKS
+    repeats: The number of runs of each benchmark and size, the fastest one being kept
+    seed: The seed of the random genomes
+
+    Returns:
+    A list of dictionaries (benchmark, size, seconds, ns_per_base, exponent) for each benchmark and
+    size, exponent being the scaling of the benchmark fitted over all the sizes (see fit_scaling)
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        cases = _micro_cases(k, directory)
+        for name in benchmarks:
+            prepare, run = cases[name]
+            rows = []
+            for size in sizes:
+                genome = _synthetic_genome(size, random.Random(seed))
+                best = float("inf")
+                for _ in range(repeats):
+                    argument = prepare(genome, random.Random(seed))
+                    start = perf_counter()
+                    run(argument)
+                    best = min(best, perf_counter() - start)
+                    del argument
+                rows.append({"benchmark": name, "size": size, "seconds": best, "ns_per_base": 1e9 * best / size})
+            exponent = fit_scaling(sizes, [row["seconds"] for row in rows])
+            for row in rows:
+                row["exponent"] = exponent
+            results.extend(rows)
+    return results
+
+
+def print_table(results: List[Dict]) -> None:
+    """
+    Prints benchmark results as an aligned table.
+
+    Parameter:
+    results: A list of dictionaries sharing the same keys
+
+    Example:
+    >>> print_table([{"threads": 1, "seconds": 2.0}, {"threads": 4, "seconds": 0.5}])
+    threads  seconds
+          1    2.000
+          4    0.500
+    """
+    if not results:
+        return
+    columns = list(results[0])
+    cells = [[f"{row[col]:.3f}" if isinstance(row[col], float) else str(row[col]) for col in columns]
+             for row in results]
+    widths = [max(len(col), *(len(line[i]) for line in cells)) for i, col in enumerate(columns)]
+    print("  ".join(col.rjust(width) for col, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--json", required=False, type=str,
+                        help="Also write the results in this JSON file")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    # Parallel kmers counting
+    threads_parser = subparsers.add_parser("threads", help="Speedup of the kmers counting per number of processes")
+    threads_parser.add_argument("-r", "--reads_file", required=True, type=str,
+                                help="Reads to count")
+    threads_parser.add_argument("-k", "--kmers_length", required=True, type=int,
+                                help="Length of kmers to extract")
+    threads_parser.add_argument("-t", "--threads", required=False, type=int, nargs="+", default=[1, 2, 4, 8],
+                                help="Numbers of processes to benchmark")
+
+    # Reads parsing
+    parse_parser = subparsers.add_parser("parse", help="Reads per second of the native parser against Biopython")
+    parse_parser.add_argument("-r", "--reads_file", required=True, type=str,
+                              help="Reads to parse")
+
+    # Tips detection
+    tips_parser = subparsers.add_parser("tips", help="Tips detection time per graph and tip threshold")
+    tips_parser.add_argument("-r", "--reads_files", required=True, type=str, nargs="+",
+                             help="Reads whose graphs are built")
+    tips_parser.add_argument("-k", "--kmers_length", required=True, type=int,
+                             help="Length of kmers to extract")
+    tips_parser.add_argument("-kf", "--kmers_filter_threshold", required=False, type=int, default=1,
+                             help="Abundance minimal of kmers for them to being kept")
+    tips_parser.add_argument("-tt", "--tip_thresholds", required=False, type=int, nargs="+",
+                             default=[3, 10, 100, 1000], help="Tip thresholds to benchmark")
+
+    # End-to-end assembly
+    pipeline_parser = subparsers.add_parser("pipeline", help="Time per stage and peak memory of the assembly "
+                                            "of reads files for each combination of -k, -kf and -tt")
+    pipeline_parser.add_argument("-r", "--reads_files", required=False, type=str, nargs="+",
+                                 default=sorted(glob.glob("Level*.fa.gz")),
+                                 help="Reads to assemble (default: the LevelN.fa.gz files of this directory)")
+    pipeline_parser.add_argument("-k", "--kmers_lengths", required=False, type=int, nargs="+", default=[21, 31],
+                                 help="Lengths of kmers to benchmark")
+    pipeline_parser.add_argument("-kf", "--kmers_filter_thresholds", required=False, type=int, nargs="+",
+                                 default=[1, 3], help="Abundances minimal of kmers to benchmark")
+    pipeline_parser.add_argument("-tt", "--tip_thresholds", required=False, type=int, nargs="+", default=[3],
+                                 help="Tip thresholds to benchmark")
+    pipeline_parser.add_argument("-n", "--repeats", required=False, type=int, default=1,
+                                 help="Runs of each combination, the fastest one being kept")
+
+    # Hot paths on synthetic inputs
+    micro_parser = subparsers.add_parser("micro", help="Time of the hot paths on synthetic genomes of increasing "
+                                         "sizes, with their fitted scaling")
+    micro_parser.add_argument("-s", "--sizes", required=False, type=int, nargs="+",
+                              default=[10_000, 100_000, 1_000_000], help="Sizes of the genomes (in bases)")
+    micro_parser.add_argument("-k", "--kmers_length", required=False, type=int, default=31,
+                              help="Length of kmers")
+    micro_parser.add_argument("-B", "--benchmarks", required=False, type=str, nargs="+", choices=MICRO_BENCHMARKS,
+                              default=list(MICRO_BENCHMARKS), help="Benchmarks to run (default: all)")
+    micro_parser.add_argument("-n", "--repeats", required=False, type=int, default=3,
+                              help="Runs of each benchmark and size, the fastest one being kept")
+    micro_parser.add_argument("--seed", required=False, type=int, default=0,
+                              help="Seed of the random genomes")
+    micro_parser.add_argument("--max-exponent", required=False, type=float, default=1.3,
+                              help="Fitted exponent above which a benchmark fails as superlinear (default: 1.3)")
+
+    for subparser in (pipeline_parser, micro_parser):
+        subparser.add_argument("-b", "--baseline", required=False, type=str,
+                               help="JSON results of a previous run (-j) to compare with: the command fails "
+                                    "if a time or the peak memory regresses")
+        subparser.add_argument("--tolerance", required=False, type=float, default=0.1,
+                               help="Relative increase above which a metric regresses (default: 0.1)")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "threads":
+        results = bench_threads(args.reads_file, args.kmers_length, args.threads)
+    elif args.benchmark == "parse":
+        results = bench_parse(args.reads_file)
+    elif args.benchmark == "tips":
+        results = bench_tips(args.reads_files, args.kmers_length, args.kmers_filter_threshold, args.tip_thresholds)
+    elif args.benchmark == "pipeline":
+        results = bench_pipeline(args.reads_files, args.kmers_lengths, args.kmers_filter_thresholds,
+                                 args.tip_thresholds, args.repeats)
+
+    elif args.benchmark == "micro":
+        results = bench_micro(args.sizes, args.kmers_length, args.benchmarks, args.repeats, args.seed)
+
+    regressions = 0
+    if getattr(args, "baseline", None):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if args.benchmark == "micro":
+            regressions = compare_baseline(results, baseline, args.tolerance, min_seconds=0.005,
+                                           keys=("benchmark", "size"), metrics=("seconds",))
+        else:
+            regressions = compare_baseline(results, baseline, args.tolerance)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
+    errors = []
+    if regressions:
+        errors.append(f"{regressions} regression(s) against {args.baseline}")
+    if args.benchmark == "micro":
+        superlinear = sorted({row["benchmark"] for row in results if row["exponent"] > args.max_exponent})
+        if superlinear:
+            errors.append(f"Superlinear scaling (exponent > {args.max_exponent}): {', '.join(superlinear)}")
+    if errors:
+        sys.exit("\n".join(errors))
@@ -0,0 +1,115 @@
+from typing import List
+
+# 64 bits constants used to mix the hash of the items (splitmix64)
+_MASK_64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX_1 = 0xBF58476D1CE4E5B9
+_MIX_2 = 0x94D049BB133111EB
+# Largest prime below 2**64: packed kmers are reduced modulo this prime rather than with hash(),
+# whose Mersenne modulus makes kmers differing at bases 61 positions apart collide
+_PRIME_64 = 0xFFFFFFFFFFFFFFC5
+
+
+class BloomFilter:
+
+    def __init__(self, size: int, hashes: int = 3, seed: int = 0):
+        """
+        Parameters:
+        size: The number of bits of the filter
+        hashes: The number of bits set for each item
+        seed: Filters with different seeds use independent hash functions
+        """
+        if size <= 0:
+            raise ValueError("The size of a Bloom filter must be strictly positive")
+        self.__size = size
+        self.__hashes = hashes
+        self.__seed = (seed * _GOLDEN) & _MASK_64
+        self.__bits = bytearray((size + 7) // 8)
+
+    def __positions(self, item: int) -> List[int]:
+        """
+        Returns the bits of an item, obtained by double hashing of its mixed hash.
+        """
+        h = (item % _PRIME_64 + self.__seed + _GOLDEN) & _MASK_64
+        h = ((h ^ (h >> 30)) * _MIX_1) & _MASK_64
+        h = ((h ^ (h >> 27)) * _MIX_2) & _MASK_64
+        h ^= h >> 31
+        h1 = h >> 32
+        h2 = (h & 0xFFFFFFFF) | 1
+        return [(h1 + i * h2) % self.__size for i in range(self.__hashes)]
+
+    def add(self, item: int) -> bool:
+        """
+        Adds an item to the filter.
+
+        Parameter:
+        item: A packed kmer
+
+        Returns:
+        True if the item was (probably) already in the filter, False otherwise
+
+        Examples:
+        >>> bloom = BloomFilter(1024)
+        >>> bloom.add(42)
+        False
+        >>> bloom.add(42)
+        True
+        >>> 42 in bloom, 43 in bloom
+        (True, False)
+        """
+        present = True
+        for position in self.__positions(item):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.__bits[byte] & bit:
+                present = False
+                self.__bits[byte] |= bit
+        return present
+
+    def __contains__(self, item: int) -> bool:
+        return all(self.__bits[position >> 3] & (1 << (position & 7)) for position in self.__positions(item))
+
+    def fill_ratio(self) -> float:
+        """
+        Returns the fraction of bits set in the filter.
+
+        Example:
+        >>> bloom = BloomFilter(800, hashes=2)
+        >>> bloom.add(1)
+        False
+        >>> bloom.fill_ratio()
+        0.0025
+        """
+        return int.from_bytes(self.__bits, "little").bit_count() / self.__size
+
+    def false_positive_rate(self) -> float:
+        """
+        Estimates the false positive rate of the filter in its current state: the probability
+        that an item never added has all its bits set, computed from the fill ratio as
+        fill_ratio ** hashes (the bits being assumed independent). It is not an observed rate.
+
+        Example:
+        >>> BloomFilter(800).false_positive_rate()
+        0.0
+        """
+        return self.fill_ratio() ** self.__hashes
+
+
+def bloom_cascade(threshold: int, size: int, hashes: int = 3) -> List[BloomFilter]:
+    """
+    Creates the cascade of Bloom filters needed to keep the kmers seen less than threshold times
+    out of the count table: threshold - 1 independent filters sharing size bits.
+
+    Parameters:
+    threshold: The minimal abundance of the kmers to count
+    size: The total number of bits of the filters
+    hashes: The number of bits set for each item
+
+    Returns:
+    A list of Bloom filters
+
+    Example:
+    >>> len(bloom_cascade(3, 1024))
+    2
+    """
+    # Each level uses its own hash functions, otherwise their false positives would be correlated
+    return [BloomFilter(max(size // (threshold - 1), 1), hashes, seed) for seed in range(threshold - 1)]
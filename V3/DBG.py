@@ -1,30 +1,366 @@
-from collections import defaultdict
-from typing import Dict, List, Set, Tuple
+import multiprocessing
+import sys
+from collections import deque
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from Instrument import RunReport
+from KmerTable import KmerTable
+from Script import NUCLEOTIDES, canonical as canonical_kmer, decode, encode, reverse_complement, write_fasta
+from UnitigGraph import UnitigGraph
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+# Shifts and masks reversing the order of the 2 bits bases of 64 bits words
+_REVERSE_STEPS = [(np.uint64(shift), np.uint64(mask)) for shift, mask in
+                  [(2, 0x3333333333333333), (4, 0x0F0F0F0F0F0F0F0F), (8, 0x00FF00FF00FF00FF),
+                   (16, 0x0000FFFF0000FFFF), (32, 0x00000000FFFFFFFF)]]
+# Default maximum length (in nodes) of the bubble branches: the bubbles of Level2 need more than
+# 1000 nodes. The nodes explored from each branching node are bounded by 10 times this length
+_BUBBLE_LENGTH = 1500
+
+
+class Contig(NamedTuple):
+    """
+    A contig of the graph (see DBG.iter_contigs).
+    """
+    # Name of the contig in the fasta file
+    id: str
+    sequence: str
+    length: int
+    # Mean count of the kmers of the contig (0 if it is a single (k-1)-mer)
+    coverage: float
 
 
 class DBG:
 
-    def __init__(self, kmers_dict):
-        self.__kmers_dict = kmers_dict
-        self.__graph = defaultdict(list)
-        self.__reverse_graph = defaultdict(list)
-        self.__build_graph()
-    
-    def __build_graph(self):
+    def __init__(self, kmers_dict, k: Optional[int] = None, canonical: bool = False):
+        """
+        Parameters:
+        kmers_dict: The dictionary of kmers and their counts, packed with Script.encode
+                    (or given as strings, they are then packed here)
+        k: The size of the kmers, required when the kmers are packed
+        canonical: If True, each kmer of kmers_dict stands for both strands (see Script.canonical):
+                   the graph then contains both orientations and each contig is only extracted once
+
+        Each node ((k-1)-mer) is given a dense integer ID, in order of first appearance in kmers_dict,
+        and the edges (kmers) are stored as CSR arrays: the successors of a node are the targets of
+        the edges between offsets[node] and offsets[node + 1]. The kmers dictionary is not kept.
+
+        Example:
+        >>> g = DBG({'ATG':1, 'CAT':2, 'TGG':1}, canonical=True)
+        >>> g.get_kmers_dict()
+        {'ATG': 3, 'CCA': 1}
+        >>> g.get_successors('AT')
+        ['TG']
+        >>> g.get_successors('CC')
+        ['CA']
+        """
+        self.__canonical = canonical
+        if k is None:
+            # Kmers given as strings: pack them once
+            k = len(next(iter(kmers_dict))) if kmers_dict else 0
+            packed_dict = {}
+            for kmer, count in kmers_dict.items():
+                kmer = canonical_kmer(encode(kmer), k) if canonical else encode(kmer)
+                packed_dict[kmer] = packed_dict.get(kmer, 0) + count
+            kmers_dict = packed_dict
+        self.__k = k
+        # Mask keeping the k-1 last nucleotides of a packed kmer
+        self.__node_mask = (1 << 2 * max(k - 1, 0)) - 1
+        self.__build(kmers_dict)
+        # Nodes whose edges changed since the last simplification pass
+        self.__dirty: Set[int] = set()
+
+    def __build(self, kmers_dict) -> None:
+        """
+        Interns the nodes of the kmers and builds the CSR arrays of the graph. The per-edge and
+        per-node arrays are kept as memoryviews, whose items are read as Python integers.
+        """
+        k = self.__k
+        size = len(kmers_dict) if k >= 2 else 0
+        # Packed kmers fit in 64 bits up to k = 32, longer ones are kept as Python integers
+        dtype = np.uint64 if k <= 32 else object
+        if isinstance(kmers_dict, KmerTable) and dtype is np.uint64:
+            # The mapped table is read at once instead of kmer by kmer
+            kmers, counts = _table_arrays(kmers_dict)
+            kmers, counts = kmers[:size], counts[:size]
+        else:
+            kmers = np.fromiter(iter(kmers_dict) if size else (), dtype=dtype, count=size)
+            counts = np.fromiter(kmers_dict.values() if size else (), dtype=np.uint32, count=size)
+
+        twins = None
+        if self.__canonical:
+            # Both orientations of each kmer, next to each other (only once for a palindrome)
+            reverses = self.__reverse_complements(kmers)
+            kept = np.ones(2 * size, dtype=bool)
+            kept[1::2] = reverses != kmers
+            kmers = np.stack((kmers, reverses), axis=1).ravel()[kept]
+            counts = np.repeat(counts, 2)[kept]
+            positions = np.cumsum(kept) - 1
+            forward, backward, palindromes = positions[0::2], positions[1::2], ~kept[1::2]
+            twins = np.empty(len(kmers), dtype=np.int64)
+            twins[forward] = np.where(palindromes, forward, backward)
+            twins[backward[~palindromes]] = forward[~palindromes]
+
+        # Node IDs, given in order of first appearance
+        ends = np.stack((kmers >> 2, kmers & self.__node_mask), axis=1).ravel()
+        nodes, first, inverse = np.unique(ends, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind="stable")
+        ids = np.empty(len(nodes), dtype=np.int32)
+        ids[order] = np.arange(len(nodes), dtype=np.int32)
+        ends = ids[inverse.ravel()]
+        sources, targets = ends[0::2], ends[1::2]
+
+        # Edge IDs: the edges are sorted by source, then by last base (successors in ACGT order)
+        edges = np.lexsort(((kmers & 3).astype(np.int8), sources))
+        positions = np.empty(len(edges), dtype=np.int64)
+        positions[edges] = np.arange(len(edges))
+        sources, targets, counts = sources[edges], targets[edges], counts[edges]
+        # Reverse CSR: the edges sorted by target, then by first base (predecessors in ACGT order)
+        first_bases = (kmers[edges] >> 2 * max(k - 1, 0)).astype(np.int8)
+        in_edges = np.lexsort((first_bases, targets)).astype(np.int32)
+
+        out_degrees = np.bincount(sources, minlength=len(nodes)).astype(np.uint8)
+        in_degrees = np.bincount(targets, minlength=len(nodes)).astype(np.uint8)
+        out_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(out_degrees, out=out_offsets[1:])
+        in_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(in_degrees, out=in_offsets[1:])
+
+        # Per node: packed (k-1)-mer, degrees and offsets of its edges in both directions
+        node_kmers = nodes[order]
+        self.__node_kmers = memoryview(node_kmers) if dtype is np.uint64 else node_kmers.tolist()
+        self.__out_degrees = memoryview(out_degrees)
+        self.__in_degrees = memoryview(in_degrees)
+        self.__out_offsets = memoryview(out_offsets)
+        self.__in_offsets = memoryview(in_offsets)
+        # Sorted nodes and their IDs, to find the ID of a node
+        self.__sorted_nodes = nodes
+        self.__sorted_ids = ids
+        # Per edge: source, target, count, if it was not removed, and its other orientation
+        self.__sources = memoryview(sources)
+        self.__targets = memoryview(targets)
+        self.__counts = memoryview(counts)
+        self.__alive = memoryview(np.ones(len(edges), dtype=bool))
+        self.__twins = None if twins is None else memoryview(positions[twins[edges]].astype(np.int32))
+        # Edges of the reverse CSR
+        self.__in_edges = memoryview(in_edges)
+        # Number of kmers left in the graph
+        self.__kmers_count = size
+
+    def __reverse_complements(self, kmers: np.ndarray) -> np.ndarray:
+        """
+        Returns the reverse complements of an array of packed kmers (see Script.reverse_complement).
+
+        Example:
+        >>> g = DBG({}, 3)
+        >>> kmers = np.array([encode('ATG'), encode('CCA')], dtype=np.uint64)
+        >>> [decode(int(kmer), 3) for kmer in g._DBG__reverse_complements(kmers)]
+        ['CAT', 'TGG']
+        """
+        if kmers.dtype == object:
+            return np.array([reverse_complement(kmer, self.__k) for kmer in kmers], dtype=object)
+        # The complement of a base is its bitwise complement
+        words = ~kmers
+        for shift, mask in _REVERSE_STEPS:
+            words = ((words >> shift) & mask) | ((words & mask) << shift)
+        return words >> np.uint64(64 - 2 * self.__k)
+
+    # Node IDs helpers
+
+    def __node_id(self, node: str) -> int:
+        """
+        Returns the ID of a node given as a string, -1 if it is not in the graph.
+
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1})
+        >>> g._DBG__node_id('TG'), g._DBG__node_id('CC')
+        (1, -1)
+        """
+        if len(node) != self.__k - 1:
+            return -1
+        packed = encode(node)
+        index = int(np.searchsorted(self.__sorted_nodes, packed))
+        if index < len(self.__sorted_nodes) and self.__sorted_nodes[index] == packed:
+            return int(self.__sorted_ids[index])
+        return -1
+
+    def __out_edges(self, node: int) -> List[int]:
+        """
+        Returns the edges leaving a node.
+        """
+        alive = self.__alive
+        return [edge for edge in range(self.__out_offsets[node], self.__out_offsets[node + 1]) if alive[edge]]
+
+    def __in_edges_of(self, node: int) -> List[int]:
+        """
+        Returns the edges reaching a node.
+        """
+        alive, in_edges = self.__alive, self.__in_edges
+        return [in_edges[i] for i in range(self.__in_offsets[node], self.__in_offsets[node + 1])
+                if alive[in_edges[i]]]
+
+    def __successors(self, node: int) -> List[int]:
+        """
+        Returns the list of successors of a node.
+        """
+        alive, targets = self.__alive, self.__targets
+        return [targets[edge] for edge in range(self.__out_offsets[node], self.__out_offsets[node + 1])
+                if alive[edge]]
+
+    def __predecessors(self, node: int) -> List[int]:
+        """
+        Returns the list of predecessors of a node.
+        """
+        alive, sources, in_edges = self.__alive, self.__sources, self.__in_edges
+        return [sources[in_edges[i]] for i in range(self.__in_offsets[node], self.__in_offsets[node + 1])
+                if alive[in_edges[i]]]
+
+    def __edge(self, source: int, target: int) -> int:
+        """
+        Returns the edge linking two nodes, -1 if there is none.
+        """
+        alive, targets = self.__alive, self.__targets
+        for edge in range(self.__out_offsets[source], self.__out_offsets[source + 1]):
+            if targets[edge] == target and alive[edge]:
+                return edge
+        return -1
+
+    def __key(self, edge: int) -> int:
+        """
+        Returns the edge standing for the kmer of an edge: the same one for both orientations in
+        canonical mode.
+        """
+        return min(edge, self.__twins[edge]) if self.__twins is not None else edge
+
+    def __edge_kmer(self, edge: int) -> int:
+        """
+        Returns the packed kmer of an edge.
+        """
+        return (self.__node_kmers[self.__sources[edge]] << 2) | (self.__node_kmers[self.__targets[edge]] & 3)
+
+    def __nodes(self, reverse: bool = False) -> List[int]:
+        """
+        Returns the nodes having successors (predecessors if reverse is True), by increasing ID.
+
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1})
+        >>> g._DBG__decode_path(g._DBG__nodes()), g._DBG__decode_path(g._DBG__nodes(reverse=True))
+        (['AT', 'TG', 'GG'], ['TG', 'GG', 'GA', 'GT'])
+        """
+        return np.flatnonzero(np.asarray(self.__in_degrees if reverse else self.__out_degrees)).tolist()
+
+    def __decode_path(self, path: List[int]) -> List[str]:
+        """
+        Unpacks every node of a path.
+
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1})
+        >>> g._DBG__decode_path([0, 1])
+        ['AT', 'TG']
+        """
+        return [decode(self.__node_kmers[node], self.__k - 1) for node in path]
+
+    def __path_edges(self, path: List[int]) -> Iterator[int]:
+        """
+        Yields the edges linking consecutive nodes of a path (-1 for a missing edge).
+
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1})
+        >>> path = [g._DBG__node_id(node) for node in ['AT', 'TG', 'GG']]
+        >>> [decode(g._DBG__edge_kmer(edge), 3) for edge in g._DBG__path_edges(path)]
+        ['ATG', 'TGG']
+        """
+        for i in range(len(path) - 1):
+            yield self.__edge(path[i], path[i + 1])
+
+    # Graph edition
+
+    def __remove_edge(self, edge: int) -> bool:
+        """
+        Removes an edge from the graph (with its other orientation in canonical mode) and marks
+        its two nodes as dirty.
+
+        Returns:
+        False if the edge was not in the graph
+        """
+        if edge < 0 or not self.__alive[edge]:
+            return False
+        twin = edge if self.__twins is None else self.__twins[edge]
+        for removed in {edge, twin}:
+            source, target = self.__sources[removed], self.__targets[removed]
+            self.__alive[removed] = False
+            self.__out_degrees[source] -= 1
+            self.__in_degrees[target] -= 1
+            self.__dirty.update((source, target))
+        self.__kmers_count -= 1
+        return True
+
+    def remove_edge(self, kmer: str) -> bool:
+        """
+        Removes an edge from the graph. Only the two nodes it links are updated, and they are kept
+        in the dirty nodes so that the next incremental pass only revisits their neighbourhood.
+
+        Parameter:
+        kmer: The kmer linking the two nodes
+
+        Returns:
+        True if the edge was removed, False if it was not in the graph
+
+        Examples:
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1})
+        >>> g.remove_edge('TGG'), g.remove_edge('TGG')
+        (True, False)
+        >>> g.get_graph(), g.get_dirty_nodes()
+        ({'AT': ['TG'], 'GG': ['GA']}, ['GG', 'TG'])
         """
-        Builds the graph by linking kmer prefixes and suffixes in self.__graph 
-        and suffixes and prefixes in self.__revers_graph.
+        source, target = self.__node_id(kmer[:-1]), self.__node_id(kmer[1:])
+        if source < 0 or target < 0:
+            return False
+        return self.__remove_edge(self.__edge(source, target))
+
+    def __degree(self, node: int) -> int:
         """
-        self.__graph = defaultdict(list)  # Réinitialise le graphe
-        self.__reverse_graph = defaultdict(list)
+        Returns the degrees of a node, packed as in_degree << 3 | out_degree.
 
-        for kmer in self.__kmers_dict:
-            if len(kmer) < 2:
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1, 'TGT':1})
+        >>> [(g._DBG__degree(node) >> 3, g._DBG__degree(node) & 7) for node in range(4)]
+        [(0, 1), (1, 2), (1, 0), (1, 0)]
+        """
+        return self.__in_degrees[node] << 3 | self.__out_degrees[node]
+
+    def get_dirty_nodes(self) -> List[str]:
+        """
+        Returns the (sorted) nodes whose edges changed since the last simplification pass.
+        """
+        return sorted(self.__decode_path(self.__dirty))
+
+    def __take_dirty(self) -> Set[int]:
+        """
+        Returns the dirty nodes and forgets them.
+        """
+        dirty, self.__dirty = self.__dirty, set()
+        return dirty
+
+    def __affected_nodes(self, dirty: Set[int]) -> Set[int]:
+        """
+        Returns the nodes around which a tip or a bubble may have appeared after changes on the
+        dirty nodes: the ends of their non-branching paths and the branching nodes just before them.
+        """
+        affected = set()
+        # Nodes of the paths already walked, each path is only walked once
+        walked = set()
+        for node in dirty:
+            if node in walked:
                 continue
-            prefix = kmer[:-1]
-            suffix = kmer[1:]
-            self.__graph[prefix].append(suffix)
-            self.__reverse_graph[suffix].append(prefix)
+            path = self.__simple_path(node)
+            walked.update(path)
+            affected.update((path[0], path[-1]))
+            affected.update(self.__predecessors(path[0]))
+        return affected
 
     #Get method
 
@@ -45,7 +381,8 @@ class DBG:
         >>> g.get_successors("TG")
         ['GG', 'GT']
         """
-        return self.__graph.get(node, [])
+        node = self.__node_id(node)
+        return self.__decode_path(self.__successors(node)) if node >= 0 else []
     
     def get_predecessors (self, node: str) -> List[str]:
         """
@@ -64,7 +401,8 @@ class DBG:
         >>> g.get_predecessors("AT")
         []
         """
-        return self.__reverse_graph.get(node, [])
+        node = self.__node_id(node)
+        return self.__decode_path(self.__predecessors(node)) if node >= 0 else []
 
     def get_graph(self)-> Dict[str, List[str]]:
         """
@@ -78,7 +416,8 @@ class DBG:
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GG', 'GT'], 'GG': ['GA']}
         """
-        return dict(self.__graph)
+        return {decode(self.__node_kmers[node], self.__k - 1): self.__decode_path(self.__successors(node))
+                for node in self.__nodes()}
     
     def get_reverse_graph(self) -> Dict[str, List[str]]:
     
@@ -93,8 +432,49 @@ class DBG:
         >>> g.get_reverse_graph()
         {'TG': ['AT'], 'GG': ['TG'], 'GA': ['GG']}
         """
-        return dict(self.__reverse_graph)
+        return {decode(self.__node_kmers[node], self.__k - 1): self.__decode_path(self.__predecessors(node))
+                for node in self.__nodes(reverse=True)}
     
+    def get_size(self) -> Tuple[int, int]:
+        """
+        Returns the size of the graph: its nodes having edges and its edges (both strands of each
+        kmer if the graph is canonical).
+
+        Example:
+        >>> DBG({'ATG':1, 'TGG':1, 'TGT':1}).get_size()
+        (4, 3)
+        """
+        nodes = (np.asarray(self.__out_degrees) > 0) | (np.asarray(self.__in_degrees) > 0)
+        return int(np.count_nonzero(nodes)), self.__kmers_count
+
+    def get_memory(self) -> Dict[str, int]:
+        """
+        Returns the memory (in bytes) held by each array of the graph: the per-node arrays
+        (node_kmers, degrees, CSR offsets and the sorted nodes used to find node IDs) and the
+        per-edge arrays (sources, targets, counts, alive, twins and the reverse CSR in_edges).
+
+        Example:
+        >>> memory = DBG({'ATG':1, 'TGG':1, 'TGT':1}).get_memory()
+        >>> memory['targets'], memory['out_offsets'], memory['twins']
+        (12, 40, 0)
+        """
+        arrays = {"node_kmers": self.__node_kmers, "out_degrees": self.__out_degrees,
+                  "in_degrees": self.__in_degrees, "out_offsets": self.__out_offsets,
+                  "in_offsets": self.__in_offsets, "sorted_nodes": self.__sorted_nodes,
+                  "sorted_ids": self.__sorted_ids, "sources": self.__sources, "targets": self.__targets,
+                  "counts": self.__counts, "alive": self.__alive, "twins": self.__twins,
+                  "in_edges": self.__in_edges}
+        memory = {}
+        for name, array in arrays.items():
+            if array is None:
+                memory[name] = 0
+            elif isinstance(array, list):
+                # Kmers longer than 32 nucleotides are kept as Python integers
+                memory[name] = sys.getsizeof(array) + sum(sys.getsizeof(kmer) for kmer in array)
+            else:
+                memory[name] = array.nbytes
+        return memory
+
     def get_kmers_dict(self):
         """
         Returns the kmers dictionnary used in the graph.
@@ -107,7 +487,16 @@ class DBG:
         >>> g.get_kmers_dict()
         {'ATG': 1, 'TGG': 1, 'GGA': 1}
         """
-        return self.__kmers_dict
+        kmers_dict = {}
+        for edge in range(len(self.__alive)):
+            if not self.__alive[edge] or self.__key(edge) != edge:
+                continue
+            kmer = self.__edge_kmer(edge)
+            if self.__twins is not None:
+                # The canonical kmer is the smallest orientation
+                kmer = min(kmer, self.__edge_kmer(self.__twins[edge]))
+            kmers_dict[decode(kmer, self.__k)] = self.__counts[edge]
+        return kmers_dict
     
     # Path construction
 
@@ -125,34 +514,41 @@ class DBG:
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1})
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GG', 'GT'], 'GG': ['GA']}
-        >>> g._DBG__extend_forward('AT')
+        >>> extend = lambda node: g._DBG__decode_path(g._DBG__extend_forward(g._DBG__node_id(node)))
+        >>> extend('AT')
         ['AT', 'TG']
-        >>> g._DBG__extend_forward('TG')
+        >>> extend('TG')
         ['TG']
-        >>> g._DBG__extend_forward('GG')
+        >>> extend('GG')
         ['GG', 'GA']
-        >>> g._DBG__extend_forward('GT')
+        >>> extend('GT')
         ['GT']
-        >>> g._DBG__extend_forward('GG')
+        >>> extend('GG')
         ['GG', 'GA']
-        >>> g._DBG__extend_forward('GA')
+        >>> extend('GA')
         ['GA']
         """
         path = [start_node]
         current_node = start_node
-
-        while True:
-            successors = self.get_successors(current_node)
-            if len(successors) != 1:
-                # Bifurcation or path end
+        # Degrees are read directly: two nodes are linked by a single kmer at most, so the only
+        # predecessor of a node of in-degree 1 is the node it was reached from
+        alive, targets, offsets = self.__alive, self.__targets, self.__out_offsets
+        out_degrees, in_degrees = self.__out_degrees, self.__in_degrees
+
+        while out_degrees[current_node] == 1:
+            # Only live edge of the node
+            edge = offsets[current_node]
+            while not alive[edge]:
+                edge += 1
+            next_node = targets[edge]
+
+            if in_degrees[next_node] != 1:
+                # Successor has multiple predecessors
                 break
 
-            next_node = successors[0]
-            predecessors_of_next = self.get_predecessors(next_node)
-
-            if len(predecessors_of_next) != 1 or predecessors_of_next[0] != current_node:
-                # Successor has multiple predecessors or non-unique link
-                break  
+            if next_node == start_node:
+                # Back to the start: circular path
+                break
 
             path.append(next_node)
             current_node = next_node
@@ -173,43 +569,51 @@ class DBG:
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1})
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GG', 'GT'], 'GG': ['GA']}
-        >>> g._DBG__extend_backward('AT')
+        >>> extend = lambda node: g._DBG__decode_path(g._DBG__extend_backward(g._DBG__node_id(node)))
+        >>> extend('AT')
         []
-        >>> g._DBG__extend_backward('TG')
+        >>> extend('TG')
         ['AT']
-        >>> g._DBG__extend_backward('GG')
+        >>> extend('GG')
         []
-        >>> g._DBG__extend_backward('GT')
+        >>> extend('GT')
         []
-        >>> g._DBG__extend_backward('GA')
+        >>> extend('GA')
         ['GG']
         """
         path = []
         current_node = start_node
-
-        while True:
-            predecessors = self.get_predecessors(current_node)
-            if len(predecessors) != 1:
-                # Bifurcation or path start
+        alive, sources, in_edges, offsets = self.__alive, self.__sources, self.__in_edges, self.__in_offsets
+        out_degrees, in_degrees = self.__out_degrees, self.__in_degrees
+
+        while in_degrees[current_node] == 1:
+            # Only live edge reaching the node
+            i = offsets[current_node]
+            while not alive[in_edges[i]]:
+                i += 1
+            pred = sources[in_edges[i]]
+
+            if out_degrees[pred] != 1:
+                # Predecessor has multiple successors
                 break 
 
-            pred = predecessors[0]
-            successors_of_pred = self.get_successors(pred)
-
-            if len(successors_of_pred) != 1 or successors_of_pred[0] != current_node:
-                # Predecessor has multiple successors or non-unique link
-                break 
+            if pred == start_node:
+                # Back to the start: circular path
+                break
             
-            # Add to start to keep the order
-            path.insert(0, pred)  
+            # Nodes are appended, then put back in order once (inserting at the start is quadratic)
+            path.append(pred)
             current_node = pred
 
+        path.reverse()
         return path
 
     def __simple_path(self, start_node):
         """
 
-        Combines forward and backward extensions to create a maximum linear path.
+        Combines forward and backward extensions to create a maximum linear path. Each node is
+        reached once: the path is built in O(length), and a circular path is walked once, from
+        start_node.
         
         Parameter:
         start_node: The starting node
@@ -221,24 +625,71 @@ class DBG:
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1})
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GG', 'GT'], 'GG': ['GA']}
-        >>> g._DBG__simple_path('AT')
+        >>> simple_path = lambda node: g._DBG__decode_path(g._DBG__simple_path(g._DBG__node_id(node)))
+        >>> simple_path('AT')
         ['AT', 'TG']
-        >>> g._DBG__simple_path('TG')
+        >>> simple_path('TG')
         ['AT', 'TG']
-        >>> g._DBG__simple_path('GG')
+        >>> simple_path('GG')
         ['GG', 'GA']
-        >>> g._DBG__simple_path('GT')
+        >>> simple_path('GT')
         ['GT']
-        >>> g._DBG__simple_path('GA')
+        >>> simple_path('GA')
         ['GG', 'GA']
+
+        #Cas circulaire
+        >>> g = DBG({'ACG':1, 'CGT':1, 'GTA':1, 'TAC':1})
+        >>> simple_path('GT')
+        ['GT', 'TA', 'AC', 'CG']
         """
-        backward_path = self.__extend_backward(start_node)
         forward_path = self.__extend_forward(start_node)
+        last_successors = self.__successors(forward_path[-1])
+        if last_successors == [start_node] and self.__predecessors(start_node) == [forward_path[-1]]:
+            # Circular path: the forward extension already went all around
+            return forward_path
+
+        backward_path = self.__extend_backward(start_node)
         # Merge without start_node duplication
         full_path = backward_path + forward_path 
 
         return full_path
 
+    def compact(self) -> UnitigGraph:
+        """
+        Builds the compacted graph: each maximal non-branching path is stored once as a unitig,
+        with its sequence, length and mean abundance (see UnitigGraph).
+
+        Returns:
+        The unitig graph
+
+        Example:
+        >>> g = DBG({'ATG':1, 'TGC':1, 'GCA':1, 'CAA':1, 'GCT':1, 'CTA':1, 'TAA':1})
+        >>> len(g.get_graph()), len(g.compact())
+        (6, 4)
+        """
+        unitigs = UnitigGraph(self.__k, self.__canonical)
+        # Index of the unitig starting with a node, and last node of each unitig
+        first_nodes = {}
+        last_nodes = []
+        visited = bytearray(len(self.__out_degrees))
+
+        for node in chain(self.__nodes(), self.__nodes(reverse=True)):
+            if visited[node]:
+                continue
+            path = self.__simple_path(node)
+            for path_node in path:
+                visited[path_node] = 1
+            sequence = self.__node_kmers[path[0]]
+            for next_node in path[1:]:
+                sequence = (sequence << 2) | (self.__node_kmers[next_node] & 3)
+            counts = [self.__counts[edge] for edge in self.__path_edges(path)]
+            first_nodes[path[0]] = unitigs.add_unitig(sequence, len(path) + self.__k - 2, len(counts), sum(counts))
+            last_nodes.append(path[-1])
+
+        for unitig, last_node in enumerate(last_nodes):
+            for edge in self.__out_edges(last_node):
+                unitigs.add_edge(unitig, first_nodes[self.__targets[edge]], self.__counts[edge])
+        return unitigs
 
     # Assembly options
 
@@ -255,7 +706,7 @@ class DBG:
 
         Examples:
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGC':1})
-        >>> p = g._DBG__simple_path('AT')
+        >>> p = g._DBG__decode_path(g._DBG__simple_path(g._DBG__node_id('AT')))
         >>> print(p)
         ['AT', 'TG', 'GG', 'GC']
         >>> g.is_tip(p)
@@ -269,7 +720,17 @@ class DBG:
         last_node = path[-1]
         return not self.get_successors(last_node)
 
-    def find_all_tips(self, threshold:int=5) -> List[Tuple[List[str], Set[str]]]:
+    def __is_tip(self, path: List[int], threshold: int) -> bool:
+        """
+        Checks if a path of node IDs is a tip (see is_tip).
+        """
+        if not path or len(path) >= threshold:
+            return False
+        
+        last_node = path[-1]
+        return not self.__successors(last_node)
+
+    def find_all_tips(self, threshold:int=5) -> List[List[str]]:
         """
         Detects all tips in the graph under a certain threshold
 
@@ -277,12 +738,12 @@ class DBG:
         threshold: The maximum path length considered as a tip
 
         Returns:
-        A list of tuples containing the path and the kmers used
+        A list of the paths of the tips
 
         Examples:
         #Cas 1 : 1 seul tip
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGC':1})
-        >>> g._DBG__simple_path('AT')
+        >>> g._DBG__decode_path(g._DBG__simple_path(g._DBG__node_id('AT')))
         ['AT', 'TG', 'GG', 'GC']
         >>> g.find_all_tips()
         [['AT', 'TG', 'GG', 'GC']]
@@ -290,7 +751,7 @@ class DBG:
         #Cas 2 : 3 tips
         >>> g = DBG({'ATG': 1, 'TGG': 1, 'GGA': 1, 'GGT': 1, 'GTC': 1, 'TCC': 1, 'TCA': 1})
         >>> g.get_graph()
-        {'AT': ['TG'], 'TG': ['GG'], 'GG': ['GA', 'GT'], 'GT': ['TC'], 'TC': ['CC', 'CA']}
+        {'AT': ['TG'], 'TG': ['GG'], 'GG': ['GA', 'GT'], 'GT': ['TC'], 'TC': ['CA', 'CC']}
         >>> g.find_all_tips(2)
         [['GG', 'GA'], ['TC', 'CC'], ['TC', 'CA']]
 
@@ -308,54 +769,69 @@ class DBG:
         >>> len(g.find_all_tips(3))  
         0
         """
+        return [self.__decode_path(tip) for tip in self.__find_tips(threshold)]
+
+    def __find_tips(self, threshold: int, nodes: Optional[Set[int]] = None) -> List[List[int]]:
+        """
+        Detects all tips in the graph as paths of node IDs (see find_all_tips). Each dead end
+        is walked back until a branching node, and given up as soon as the path reaches threshold
+        nodes: the nodes of a dead-end path are visited once, and never more than threshold of them.
+        Only the dead ends among nodes are walked if nodes is given.
+        """
+        in_degrees, out_degrees = self.__in_degrees, self.__out_degrees
+        if nodes is None:
+            ends = np.flatnonzero((np.asarray(out_degrees) == 0) & (np.asarray(in_degrees) > 0)).tolist()
+        else:
+            ends = [node for node in nodes if in_degrees[node] and not out_degrees[node]]
+
         tips = []
-        visited = set()
+        for end in ends:
+            # Path walked back from the dead end
+            path = [end]
+            while len(path) < threshold:
+                node = path[-1]
+                in_degree = in_degrees[node]
+                if not in_degree:
+                    # Short isolated path
+                    tips.append(path[::-1])
+                    break
+                predecessors = self.__predecessors(node)
+                branches = [predecessor for predecessor in predecessors if out_degrees[predecessor] > 1]
+                if branches:
+                    # The path hangs from a branching node
+                    tips.append([branches[0]] + path[::-1])
+                    break
+                if in_degree > 1:
+                    # Dead end after a junction: end of the sequence, not a tip
+                    break
+                path.append(predecessors[0])
+        return tips
 
-        potential_starts = set()
-        
-        for node in self.__graph:
+    def find_tip_edges(self, threshold: int = 5) -> List[str]:
+        """
+        Returns the edges (kmers) to remove to take all the tips out of the graph.
 
-            if not self.get_predecessors(node):
-                potential_starts.add(node)
+        Parameter:
+        threshold: The maximum path length considered as a tip
 
-            if len(self.get_successors(node)) > 1:
-                potential_starts.add(node)
-        
-        for node in potential_starts:
-            if node in visited:
-                continue
-                
-            path = self.__simple_path(node)
-            if self.is_tip(path, threshold):
-                tips.append(path)
-                visited.update(path)
-        
-        for node in list(self.__graph.keys()):
-            successors = self.get_successors(node)
-            if len(successors) <= 1:
-                continue
-                
-            for succ in successors:
-                if succ in visited:
-                    continue
-                    
-                path = self.__simple_path(succ)
-                if self.is_tip(path, threshold):
-                    full_path = [node] + path
-                    tips.append(full_path)
-                    visited.update(path)
-        
-        return tips
+        Returns:
+        The list of kmers of the tips
 
-    def remove_tips(self, threshold=5):
+        Example:
+        >>> g = DBG({'ATG': 1, 'TGG': 1, 'GGA': 1, 'GGT': 1, 'GTC': 1, 'TCC': 1, 'TCA': 1})
+        >>> g.find_tip_edges(3)
+        ['GGA', 'TCC', 'TCA']
+        """
+        return [decode(self.__edge_kmer(edge), self.__k)
+                for tip in self.__find_tips(threshold) for edge in self.__path_edges(tip)]
+
+    def remove_tips(self, threshold=5, incremental: bool = False):
         """
         Remove tips from the graph based on a length threshold.
  
-        Parameter:
-        threshold: The maximum length to be considered a tip
- 
-        Parameter:
+        Parameters:
         threshold: Maximum allowed tip length
+        incremental: If True, only look for tips around the nodes changed since the last pass
  
         Examples:
         # Cas de base : une branche principale avec un court tip
@@ -367,28 +843,170 @@ class DBG:
         {'AT': ['TG'], 'TG': ['GG'], 'GG': ['GA']}
         >>> g.get_kmers_dict()
         {'ATG': 1, 'TGG': 1, 'GGA': 1}
+
+        # Tip appearing after an edge removal
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1, 'GTC':1})
+        >>> g.remove_tips(2)
+        >>> g.remove_edge('GTC')
+        True
+        >>> g.remove_tips(2, incremental=True)
+        >>> g.get_graph()
+        {'AT': ['TG'], 'TG': ['GG'], 'GG': ['GA']}
+        """
+        dirty = self.__take_dirty()
+        self.__remove_tips(threshold, self.__affected_nodes(dirty) if incremental else None)
+
+    def __remove_tips(self, threshold: int, nodes: Optional[Set[int]]) -> int:
         """
-        k = len(next(iter(self.__kmers_dict))) 
-        tips = self.find_all_tips(threshold)
+        Removes the tips found from nodes (from the whole graph if nodes is None).
+
+        Returns:
+        The number of removed tips
+        """
+        tips = self.__find_tips(threshold, nodes)
         
         for tip in tips:  
                 
-            # Rebuild the sequence and extract kmers
-            sequence = tip[0] + ''.join(node[-1] for node in tip[1:])
-            for i in range(len(sequence) - k + 1):
-                kmer = sequence[i:i+k]
-                self.__kmers_dict.pop(kmer, None)
-        
-        self.__build_graph()
+            # Take the kmers of the tip out from the graph
+            for edge in self.__path_edges(tip):
+                self.__remove_edge(edge)
+        return len(tips)
 
 # Bubbles management
 
-    def remove_bubbles(self) -> List[Tuple[str, List[List[str]]]]:
+    def __live_successors(self, node: int, removed: Set[int]) -> List[int]:
+        """
+        Returns the successors of a node, without the edges whose keys are in removed.
+        """
+        if not removed:
+            return self.__successors(node)
+        return [self.__targets[edge] for edge in self.__out_edges(node) if self.__key(edge) not in removed]
+
+    def __live_predecessors(self, node: int, removed: Set[int]) -> List[int]:
+        """
+        Returns the predecessors of a node, without the edges whose keys are in removed.
+        """
+        if not removed:
+            return self.__predecessors(node)
+        return [self.__sources[edge] for edge in self.__in_edges_of(node) if self.__key(edge) not in removed]
+
+    def __upstream_branches(self, nodes: Set[int], max_length: int) -> Tuple[Set[int], int]:
+        """
+        Returns the branching nodes found at most max_length nodes before the given nodes (the
+        forks of the bubbles a search from them could find), and the number of visited nodes.
+        """
+        depths = dict.fromkeys(nodes, 0)
+        queue = deque(nodes)
+        branches = set()
+        while queue:
+            node = queue.popleft()
+            if self.__out_degrees[node] >= 2:
+                branches.add(node)
+            if depths[node] < max_length:
+                for predecessor in self.__predecessors(node):
+                    if predecessor not in depths:
+                        depths[predecessor] = depths[node] + 1
+                        queue.append(predecessor)
+        return branches, len(depths)
+
+    def __mean_abundance(self, path: List[int]) -> float:
+        """
+        Returns the mean count of the kmers of a path (0 if it is a single node).
+        """
+        counts = [self.__counts[edge] for edge in self.__path_edges(path)]
+        return sum(counts) / len(counts) if counts else 0.0
+
+    def __pop_bubbles(self, source: int, max_length: int, max_visited: int, removed: Set[int]) -> Tuple[int, int]:
         """
-        Detects all bubbles in the graph and remove paths to let 1 path reamining.
+        Breadth-first search from a branching node, at most max_length nodes deep and max_visited
+        nodes explored. The search stops early once every branch from the source has joined a
+        single node. When a node is reached by a second path, the two paths
+        from their fork form a bubble: the keys of the kmers of the least abundant one are added to
+        removed (unless it has other connections). Removed edges are not explored any more, so nested and
+        multi-branch bubbles are popped one branch at a time.
 
         Returns:
-        A list of tuples containing a starting node and a list of alternative paths that converge later
+        The number of popped branches and the number of visited nodes
+        """
+        parents = {source: None}
+        depths = {source: 0}
+        queue = deque([source])
+        popped = visited = 0
+        # Explored nodes without any explored successor (dead ends, or too deep) which another path
+        # may still reach: a node with a single predecessor can not be reached again
+        dead_ends = 0
+        while queue and visited < max_visited:
+            if len(queue) == 1 and not dead_ends and queue[0] != source:
+                # Every explored node leads to this one: all the branches from source have joined,
+                # and the search would only find the bubbles of the branching nodes further on
+                break
+            node = queue.popleft()
+            if depths[node] >= max_length:
+                dead_ends += self.__in_degrees[node] > 1
+                continue
+            edges = self.__out_edges(node)
+            if removed:
+                edges = [edge for edge in edges if self.__key(edge) not in removed]
+            if not edges:
+                dead_ends += self.__in_degrees[node] > 1
+            for edge in edges:
+                visited += 1
+                if removed and self.__key(edge) in removed:
+                    # Removed by a bubble popped just before
+                    continue
+                successor = self.__targets[edge]
+                if successor not in parents:
+                    parents[successor] = node
+                    depths[successor] = depths[node] + 1
+                    queue.append(successor)
+                    continue
+
+                # Second path to successor: both paths are walked back to their fork
+                first = [successor]
+                while parents[first[-1]] is not None:
+                    first.append(parents[first[-1]])
+                positions = {path_node: i for i, path_node in enumerate(first)}
+                second = [successor]
+                current = node
+                while current not in positions:
+                    second.append(current)
+                    current = parents[current]
+                visited += len(first) + len(second)
+                if current == successor:
+                    # node comes after successor: a cycle, not a bubble
+                    continue
+                first = first[:positions[current] + 1][::-1]
+                second = (second + [current])[::-1]
+
+                # The first path is kept on a tie
+                weaker = second if self.__mean_abundance(second) <= self.__mean_abundance(first) else first
+                if any(len(self.__live_predecessors(path_node, removed)) != 1
+                       or len(self.__live_successors(path_node, removed)) != 1 for path_node in weaker[1:-1]):
+                    # Removing the branch would cut other paths
+                    continue
+                removed.update(self.__key(edge) for edge in self.__path_edges(weaker))
+                popped += 1
+                if weaker is first:
+                    parents[successor] = node
+                    depths[successor] = depths[node] + 1
+        return popped, visited
+
+    def remove_bubbles(self, incremental: bool = False, max_length: Optional[int] = None,
+                       max_visited: Optional[int] = None) -> Dict[str, int]:
+        """
+        Detects the bubbles of the graph (paths leaving a node and joining again) and only keeps their
+        most abundant branch. A breadth-first search is run from each branching node (see
+        __pop_bubbles), and the branches are removed in one batch at the end. The search is
+        bounded in depth and breadth, so that its cost stays linear on repeat-rich data; the
+        bubbles longer than max_length are left (Level2 has bubbles of more than 1000 nodes).
+
+        Parameters:
+        incremental: If True, only look for bubbles around the nodes changed since the last pass
+        max_length: The maximum length (in nodes) of the branches (default: 1500)
+        max_visited: The maximum number of nodes explored from each branching node (default: 10 * max_length)
+
+        Returns:
+        The number of popped branches ("bubbles"), of removed kmers ("edges") and of visited nodes ("visited")
 
         Examples:
         >>> kmers_bulle = {'ATG':1, 'TGC':1, 'GCA':1, 'CAA':1, 'GCT':1, 'CTA':1, 'TAA':1}
@@ -396,56 +1014,160 @@ class DBG:
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GC'], 'GC': ['CA', 'CT'], 'CA': ['AA'], 'CT': ['TA'], 'TA': ['AA']}
         >>> g.remove_bubbles()
+        {'bubbles': 1, 'edges': 3, 'visited': 11}
         >>> g.get_graph()
         {'AT': ['TG'], 'TG': ['GC'], 'GC': ['CA'], 'CA': ['AA']}
+
+        # Bulle à 3 branches : la plus abondante est gardée
+        >>> from Script import kmers
+        >>> kmers_dict = {}
+        >>> for sequence, count in [('AACCATTGG', 1), ('AACCGTTGG', 5), ('AACCTTTGG', 2)]:
+        ...     for kmer in kmers(sequence, 4):
+        ...         kmers_dict[kmer] = kmers_dict.get(kmer, 0) + count
+        >>> g = DBG(kmers_dict)
+        >>> g.remove_bubbles()['bubbles']
+        2
+        >>> g._DBG__assemble_sequence(g._DBG__simple_path(g._DBG__node_id('AAC')))
+        'AACCGTTGG'
+
+        # Bulle de plus de 400 noeuds : elle n'est trouvée qu'avec une profondeur suffisante
+        >>> import random
+        >>> rng = random.Random(0)
+        >>> start, first, second, end = (''.join(rng.choice('ACGT') for _ in range(size)) for size in (50, 400, 400, 50))
+        >>> kmers_dict = {}
+        >>> for sequence, count in [(start + first + end, 5), (start + second + end, 1)]:
+        ...     for kmer in kmers(sequence, 15):
+        ...         kmers_dict[kmer] = kmers_dict.get(kmer, 0) + count
+        >>> DBG(kmers_dict).remove_bubbles(max_length=150)['bubbles']
+        0
+        >>> g = DBG(kmers_dict)
+        >>> g.remove_bubbles()['bubbles'], g.get_contigs() == [start + first + end]
+        (1, True)
         """
-        k = len(next(iter(self.__kmers_dict))) 
-        
-        # For every node
-        for node in self.__graph:
-            # Collect its successors
-            successors = self.get_successors(node)
-            # If more than one successor
-            if len(successors) >= 2:
-                # Possible point of convergence
-                convergence_point = []
-                # For every successors in successors
-                for su in successors:
-                    # Build the path of the current successor
-                    path = self.__simple_path(su)
-                    # Pick the last node of the path
-                    last_node = path[-1]
-                    # Collect its successors
-                    s = self.get_successors(last_node)
-                    # If there is only one : point of convergence
-                    if len(s) == 1:
-                        # If the successor is not added in convergence_point
-                        if s[0] not in convergence_point:
-                            # Add it
-                            convergence_point.append(s[0])
-                        # If in convergence_point : convergence point of the bubble
-                        elif s[0] in convergence_point:
-                            # Add to the path the bubble starting node
-                            path.insert(0, node)
-                            # Add the point of convergence
-                            path.append(s[0])
-                            # Assemble the sequence present in the path
-                            sequence = self.__assemble_sequence(path)
-                            # Rebuild kmers and take them out from the dictionary
-                            for i in range(len(sequence) - k + 1):
-                                kmer = sequence[i:i+k]
-                                self.__kmers_dict.pop(kmer, None)
-
-        self.__build_graph()
+        dirty = self.__take_dirty()
+        return self.__remove_bubbles(dirty if incremental else None, max_length, max_visited)
+
+    def __remove_bubbles(self, dirty: Optional[Set[int]], max_length: Optional[int],
+                         max_visited: Optional[int]) -> Dict[str, int]:
+        """
+        Pops the bubbles found around the dirty nodes (in the whole graph if dirty is None),
+        see remove_bubbles.
+        """
+        # The search is bounded, so that repeat-rich graphs (without filtering) stay linear
+        if max_length is None:
+            max_length = _BUBBLE_LENGTH
+        if max_visited is None:
+            max_visited = 10 * max_length
+        report = {"bubbles": 0, "edges": 0, "visited": 0}
+        if dirty is None:
+            nodes = self.__nodes()
+        else:
+            # A bubble through a changed node forks at most max_length nodes before it: the walk
+            # back is bounded by the bubbles cap, and its nodes are counted as visited
+            nodes, report["visited"] = self.__upstream_branches(self.__affected_nodes(dirty), max_length)
+
+        # Keys of the kmers of the popped branches
+        removed = set()
+        for node in [node for node in nodes if self.__out_degrees[node] >= 2]:
+            popped, visited = self.__pop_bubbles(node, max_length, max_visited, removed)
+            report["bubbles"] += popped
+            report["visited"] += visited
+
+        for kmer in removed:
+            self.__remove_edge(kmer)
+        report["edges"] = len(removed)
+        return report
+
+# Graph simplification
+
+    def simplify(self, tip_threshold: int = 3, max_rounds: int = 10, bubble_length: Optional[int] = None,
+                 bubble_visited: Optional[int] = None, report: Optional[RunReport] = None) -> List[Dict[str, int]]:
+        """
+        Removes tips and bubbles until nothing changes or max_rounds rounds ran. The first round
+        processes the whole graph; then each rule only runs again around the nodes changed since it
+        last ran (its worklist), since removing a bubble often exposes new tips and vice versa.
+
+        Parameters:
+        tip_threshold: The threshold for tip removal
+        max_rounds: The maximum number of rounds
+        bubble_length: The maximum length of the bubble branches (see remove_bubbles)
+        bubble_visited: The maximum number of nodes explored from each branching node (see remove_bubbles)
+        report: If given, the tips and bubbles removals are measured as its "tips" and "bubbles" stages
+
+        Returns:
+        For each round, the size of its worklist ("worklist", None for the whole graph), the numbers
+        of removed tips, popped branches and removed kmers, and the nodes visited to find bubbles
+
+        Example:
+        # La branche gardée de la bulle n'est un tip qu'une fois l'autre branche supprimée
+        >>> from Script import kmers
+        >>> kmers_dict = {}
+        >>> for sequence, count in [('GATTACACCGGTTAACGTAGC', 5), ('GATTACATGGCTA', 3), ('GATTACAGGGCTA', 1)]:
+        ...     for kmer in kmers(sequence, 4):
+        ...         kmers_dict[kmer] = kmers_dict.get(kmer, 0) + count
+        >>> g = DBG(kmers_dict)
+        >>> g.get_successors('ACA')
+        ['CAC', 'CAG', 'CAT']
+        >>> for statistics in g.simplify(7):
+        ...     print(statistics)
+        {'round': 1, 'worklist': None, 'tips': 0, 'bubbles': 1, 'edges': 4, 'visited': 60}
+        {'round': 2, 'worklist': 5, 'tips': 1, 'bubbles': 0, 'edges': 6, 'visited': 34}
+        {'round': 3, 'worklist': 7, 'tips': 0, 'bubbles': 0, 'edges': 0, 'visited': 0}
+        >>> g.get_successors('ACA')
+        ['CAC']
+
+        # Après une suppression locale, le tour suivant ne reparcourt que les abords de la bulle
+        >>> import random
+        >>> rng = random.Random(0)
+        >>> genome = ''.join(rng.choice('ACGT') for _ in range(5000))
+        >>> variant = genome[2480:2500] + ('A' if genome[2500] != 'A' else 'C') + genome[2501:2520]
+        >>> kmers_dict = {}
+        >>> for sequence, count in [(genome, 10), (variant, 1)]:
+        ...     for kmer in kmers(sequence, 15):
+        ...         kmers_dict[kmer] = kmers_dict.get(kmer, 0) + count
+        >>> g = DBG(kmers_dict)
+        >>> first, second = g.simplify(3, bubble_length=50)
+        >>> first['bubbles'], second['worklist'], second['visited'] < 100 < g.get_size()[0]
+        (1, 16, True)
+        """
+        report = report or RunReport(enabled=False)
+        self.__dirty = set()
+        rounds = []
+        # Nodes changed since each rule last ran (None: the whole graph)
+        tips_work = bubbles_work = None
+        for round_number in range(1, max_rounds + 1):
+            with report.stage("tips") as counts:
+                tips_nodes = None if tips_work is None else self.__affected_nodes(tips_work)
+                tips_edges = self.__kmers_count
+                tips = self.__remove_tips(tip_threshold, tips_nodes)
+                tips_edges -= self.__kmers_count
+                tips_dirty = self.__take_dirty()
+                counts.update(tips=tips, edges=tips_edges)
+
+            with report.stage("bubbles") as counts:
+                if bubbles_work is not None:
+                    bubbles_work |= tips_dirty
+                popped = self.__remove_bubbles(bubbles_work, bubble_length, bubble_visited)
+                bubbles_dirty = self.__take_dirty()
+                counts.update(popped)
+
+            rounds.append({"round": round_number, "worklist": None if tips_work is None else len(tips_work),
+                           "tips": tips, "bubbles": popped["bubbles"], "edges": tips_edges + popped["edges"],
+                           "visited": popped["visited"]})
+            tips_work = tips_dirty | bubbles_dirty
+            bubbles_work = bubbles_dirty
+            if not tips_work:
+                break
+        return rounds
 
 # Sequence Assembly
 
-    def __assemble_sequence(self, path: List[str]) -> str:
+    def __assemble_sequence(self, path: List[int]) -> str:
         """
         Assembles a sequence from a nodes-made path.
         
         Parameter:
-        path: A list of nodes representing the contig path
+        path: A list of node IDs representing the contig path
         
         returns:
         A single string representing the assembled sequence
@@ -453,7 +1175,7 @@ class DBG:
         Examples:
         #Cas de base
         >>> g = DBG({'ATG':1, 'TGG':1, 'GGC':1})        
-        >>> g._DBG__assemble_sequence(['AT', 'TG', 'GG', 'GC'])
+        >>> g._DBG__assemble_sequence([g._DBG__node_id(node) for node in ['AT', 'TG', 'GG', 'GC']])
         'ATGGC'
 
         #Cas 2 : chemin vide
@@ -463,44 +1185,343 @@ class DBG:
         """
         if not path:
             return ""
-        return path[0] + ''.join(node[-1] for node in path[1:])
+        # Kmers are only unpacked here, when the sequence is written
+        node_kmers = self.__node_kmers
+        return (decode(node_kmers[path[0]], self.__k - 1)
+                + ''.join(NUCLEOTIDES[node_kmers[node] & 3] for node in path[1:]))
 
-    def get_all_contigs(self, output_file: str = "output_file.fa", tip_threshold = 3) -> None:
+    def __contigs(self) -> Iterator[Tuple[str, float]]:
         """
-        Extracts all the contigs from the graph, writes them in a fasta file and deletes the used kmers.
+        Yields the contigs of the graph with the mean count of their kmers (see iter_contigs).
+        """
+        # Nodes already written: each node belongs to a single path, so every node and edge is
+        # walked once
+        visited = bytearray(len(self.__out_degrees))
+        nodes = np.flatnonzero(np.asarray(self.__out_degrees) | np.asarray(self.__in_degrees)).tolist()
+
+        for start_node in nodes:
+            if visited[start_node]:
+                # Node already processed
+                continue
 
-        Parameters:
-        output_file: Path to the output fasta file
-        tip_threshold: The threshold for tip removal
-        bubble_threshold: The threshold for bubble removal   
+            path = self.__simple_path(start_node)
+            for node in path:
+                visited[node] = 1
+
+            contig = self.__assemble_sequence(path)
+            if self.__canonical:
+                if (len(path) > 1 and self.__successors(path[-1]) == [path[0]]
+                        and self.__predecessors(path[0]) == [path[-1]]):
+                    # Both strands of a circular contig are entered at unrelated rotations, so their
+                    # sequences can not be compared: the strand holding the smallest node ID is
+                    # written (the first one reached), and the nodes of the other one are marked
+                    for edge in self.__path_edges(path):
+                        twin = self.__twins[edge]
+                        visited[self.__sources[twin]] = visited[self.__targets[twin]] = 1
+                elif contig.translate(_COMPLEMENT)[::-1] < contig:
+                    # The other strand of this contig is written instead
+                    continue
+            yield contig, self.__mean_abundance(path)
+
+    def iter_contigs(self) -> Iterator[Contig]:
+        """
+        Yields the contigs of the graph as it is (see simplify to remove tips and bubbles first),
+        lazily, while its maximal simple paths are walked. Each node is in a single contig and in
+        canonical mode, only the smallest strand of each contig is yielded (for a circular contig,
+        whose strands have no common start, the strand holding the smallest node ID).
+
+        Returns:
+        An iterator of Contig records (name, sequence, length and mean count of the kmers)
+
+        Example:
+        >>> g = DBG({'ATG':2, 'TGG':4, 'GGA':1, 'TGT':1})
+        >>> for contig in g.iter_contigs():
+        ...     print(contig)
+        Contig(id='contig_1_len_3', sequence='ATG', length=3, coverage=2.0)
+        Contig(id='contig_2_len_3', sequence='GGA', length=3, coverage=1.0)
+        Contig(id='contig_3_len_2', sequence='GT', length=2, coverage=0.0)
         """
-        self.remove_tips(tip_threshold)
-        self.remove_bubbles()
+        return _contig_records(self.__contigs())
 
-        contig_num = 1
-        k = len(next(iter(self.__kmers_dict))) 
+    def get_contigs(self) -> List[str]:
+        """
+        Returns the contigs of the graph as it is (see simplify to remove tips and bubbles first):
+        the sequences of its maximal simple paths, each node being in a single contig.
 
-        with open(output_file, 'w') as out:
-            for start_kmer in list(self.__kmers_dict.keys()):
-                if start_kmer not in self.__kmers_dict:
-                    # Kmers already processed
-                    continue  
+        Returns:
+        The list of the contigs sequences
 
-                start_node = start_kmer[:-1]
-                path = self.__simple_path(start_node)
+        Examples:
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1})
+        >>> g.get_contigs()
+        ['ATG', 'GGA', 'GT']
+
+        #Cas circulaire en mode canonique : un seul brin du cercle est écrit, quel que soit le génome
+        >>> import random
+        >>> from Script import kmers
+        >>> contigs = []
+        >>> for seed in range(1, 20):
+        ...     rng = random.Random(seed)
+        ...     genome = ''.join(rng.choice('ACGT') for _ in range(300))
+        ...     circle = DBG({kmer: 1 for kmer in kmers(genome + genome[:14], 15)}, canonical=True)
+        ...     contigs.append(len(circle.get_contigs()))
+        >>> contigs == [1] * 19
+        True
+        """
+        return [contig.sequence for contig in self.iter_contigs()]
 
-                if not path:
-                    continue
+    def __components(self) -> np.ndarray:
+        """
+        Labels the nodes by weakly connected component, with a union-find over the edges (and over
+        the two orientations of each kmer in canonical mode, so that both strands of a contig stay
+        together). The components are numbered by increasing smallest node ID.
+
+        Returns:
+        The component of each node, -1 for the nodes without edges
+        """
+        parents = list(range(len(self.__out_degrees)))
+
+        def find(node: int) -> int:
+            while parents[node] != node:
+                # Path halving
+                parents[node] = parents[parents[node]]
+                node = parents[node]
+            return node
+
+        def union(first: int, second: int) -> None:
+            first, second = find(first), find(second)
+            # The root of a component is its smallest node
+            if first < second:
+                parents[second] = first
+            elif second < first:
+                parents[first] = second
+
+        sources, targets, twins = self.__sources, self.__targets, self.__twins
+        for edge in range(len(self.__alive)):
+            if self.__alive[edge]:
+                union(sources[edge], targets[edge])
+                if twins is not None:
+                    union(sources[edge], sources[twins[edge]])
+
+        roots = np.array([find(node) for node in range(len(parents))], dtype=np.int64)
+        linked = (np.asarray(self.__out_degrees) | np.asarray(self.__in_degrees)) > 0
+        labels = np.full(len(parents), -1, dtype=np.int64)
+        labels[linked] = np.unique(roots[linked], return_inverse=True)[1]
+        return labels
+
+    def get_components(self) -> List[List[str]]:
+        """
+        Returns the weakly connected components of the graph (nodes linked by edges, whatever their
+        direction), by increasing smallest node ID.
+
+        Returns:
+        A list of the nodes of each component
 
-                sequence = self.__assemble_sequence(path)
-                for i in range(len(sequence) - k + 1):
-                                kmer = sequence[i:i+k]
-                                self.__kmers_dict.pop(kmer, None)
+        Example:
+        >>> g = DBG({'ATG':1, 'TGG':1, 'CCA':1, 'CAA':1, 'GAT':1})
+        >>> g.get_components()
+        [['AT', 'TG', 'GG', 'GA'], ['CC', 'CA', 'AA']]
+        """
+        labels = self.__components()
+        components = [[] for _ in range(labels.max() + 1)]
+        for node, label in enumerate(labels.tolist()):
+            if label >= 0:
+                components[label].append(node)
+        return [self.__decode_path(component) for component in components]
+
+    def __component_kmers(self, labels: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Splits the kmers left in the graph (in their canonical form in canonical mode) by component.
 
-                contig = self.__assemble_sequence(path)
-                out.write(f">contig_{contig_num}_len_{len(contig)}\n")
-                out.write('\n'.join(contig[i:i+60] for i in range(0, len(contig), 60)) + '\n')
-                contig_num += 1
+        Returns:
+        The packed kmers and their counts, for each component
+        """
+        if isinstance(self.__node_kmers, memoryview):
+            node_kmers = np.asarray(self.__node_kmers)
+        else:
+            node_kmers = np.array(self.__node_kmers, dtype=object)
+        sources, targets = np.asarray(self.__sources), np.asarray(self.__targets)
+        kmers = (node_kmers[sources] << 2) | (node_kmers[targets] & 3)
+        kept = np.asarray(self.__alive).copy()
+        if self.__twins is not None:
+            twins = np.asarray(self.__twins)
+            kmers = np.minimum(kmers, kmers[twins])
+            kept &= np.arange(len(twins)) <= twins
+
+        edges = np.flatnonzero(kept)
+        if not len(edges):
+            return []
+        edge_labels = labels[sources[edges]]
+        edges = edges[np.argsort(edge_labels, kind="stable")]
+        bounds = np.cumsum(np.bincount(edge_labels, minlength=labels.max() + 1))[:-1]
+        counts = np.asarray(self.__counts)
+        return [(kmers[part], counts[part]) for part in np.split(edges, bounds)]
+
+    def __parallel_contigs(self, threads: int, options: Dict) -> Tuple[List[Dict[str, int]], List[Tuple[str, float]]]:
+        """
+        Simplifies the weakly connected components of the graph and extracts their contigs in
+        threads processes. Tips and bubbles never span two components, so each one is processed
+        alone; the results are gathered in the order of the components, so the contigs are numbered
+        the same way whatever the number of processes.
 
-        print(f"Contigs générés : {contig_num - 1}")
-        print(f"{output_file} was generated\n")
\ No newline at end of file
+        Returns:
+        The simplification rounds (summed over the components) and the contigs, with the mean
+        count of their kmers
+        """
+        components = self.__component_kmers(self.__components())
+        if not components:
+            return [], []
+        # Consecutive components are batched up to a share of the kmers, so that small components
+        # do not cost a task each
+        batch_size = max(1, sum(len(kmers) for kmers, _ in components) // (4 * threads))
+        batches, sizes = [[]], [0]
+        for component in components:
+            if sizes[-1] >= batch_size:
+                batches.append([])
+                sizes.append(0)
+            batches[-1].append(component)
+            sizes[-1] += len(component[0])
+
+        # The largest batches are handed out first
+        order = sorted(range(len(batches)), key=lambda batch: -sizes[batch])
+        tasks = [(self.__k, self.__canonical, options, batches[batch]) for batch in order]
+        with multiprocessing.Pool(threads) as pool:
+            results = dict(zip(order, pool.map(_component_contigs, tasks, chunksize=1)))
+
+        rounds, contigs = [], []
+        for batch in range(len(batches)):
+            for component_rounds, component_contigs in results[batch]:
+                rounds.append(component_rounds)
+                contigs.extend(component_contigs)
+        return _merge_rounds(rounds), contigs
+
+    def get_all_contigs(self, output_file: str = "output_file.fa", tip_threshold = 3,
+                        compacted: bool = False, bubble_length: Optional[int] = None,
+                        bubble_visited: Optional[int] = None, max_rounds: int = 10,
+                        threads: int = 1, report: Optional[RunReport] = None) -> None:
+        """
+        Simplifies the graph, then writes the contigs given by iter_contigs in a fasta file (see
+        Script.write_fasta).
+
+        Parameters:
+        output_file: Path to the output fasta file, compressed in BGZF if it ends with .gz
+        tip_threshold: The threshold for tip removal
+        compacted: If True, tips, bubbles and contigs are processed on the unitig graph (see compact),
+                   with one pass of each removal: the three next parameters are then not used
+        bubble_length: The maximum length of the bubble branches (see remove_bubbles)
+        bubble_visited: The maximum number of nodes explored from each branching node (see remove_bubbles)
+        max_rounds: The maximum number of tips and bubbles removal rounds (see simplify)
+        threads: The number of processes simplifying the connected components and extracting their
+                 contigs (the contigs are then numbered component by component), and of threads
+                 compressing the output file
+        report: If given, the stages (compaction or simplification, contigs extraction and writing)
+                are measured in it
+        """
+        report = report or RunReport(enabled=False)
+        if compacted:
+            with report.stage("compact") as counts:
+                unitig_graph = self.compact()
+                counts["unitigs"] = len(unitig_graph.get_unitigs())
+            unitig_graph.get_all_contigs(output_file, tip_threshold, threads, report)
+            return
+
+        options = {"tip_threshold": tip_threshold, "max_rounds": max_rounds,
+                   "bubble_length": bubble_length, "bubble_visited": bubble_visited}
+        if threads > 1:
+            # Tips, bubbles and contigs of the components are processed together in the pool
+            with report.stage("components") as counts:
+                rounds, contigs = self.__parallel_contigs(threads, options)
+                for key in ("tips", "bubbles", "edges", "visited"):
+                    counts[key] = sum(stats[key] for stats in rounds)
+            contigs = _contig_records(contigs)
+        else:
+            rounds = self.simplify(**options, report=report)
+            # Contigs are extracted lazily, while they are written
+            contigs = report.iterate("extract", self.iter_contigs(), within="write", items="contigs")
+        print(f"Simplification : {len(rounds)} tours, {sum(stats['tips'] for stats in rounds)} tips et "
+              f"{sum(stats['bubbles'] for stats in rounds)} bulles supprimés "
+              f"({sum(stats['visited'] for stats in rounds)} noeuds visités)")
+
+        with report.stage("write") as counts:
+            records = report.contigs(((contig.id, contig.sequence) for contig in contigs), counts)
+            contig_num = write_fasta(output_file, records, threads)
+            counts["contigs"] = contig_num
+
+        print(f"Contigs générés : {contig_num}")
+        print(f"{output_file} was generated\n")
+
+
+def _component_contigs(task: Tuple) -> List[Tuple[List[Dict[str, int]], List[Tuple[str, float]]]]:
+    """
+    Process of DBG.get_all_contigs with several processes: builds the graph of each component of
+    a batch from its kmers, simplifies it and extracts its contigs.
+
+    Returns:
+    The simplification rounds and the contigs of each component
+    """
+    k, canonical, options, components = task
+    results = []
+    for kmers, counts in components:
+        dbg = DBG(dict(zip(kmers.tolist(), counts.tolist())), k, canonical)
+        rounds = dbg.simplify(**options)
+        results.append((rounds, [(contig.sequence, contig.coverage) for contig in dbg.iter_contigs()]))
+    return results
+
+
+def _table_arrays(table: KmerTable) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the kmers (of at most 32 bases) and the counts of a mapped table as numpy arrays, in the
+    order of the table, without its removed kmers.
+
+    Example:
+    >>> import os, tempfile
+    >>> from KmerTable import load_kmers, save_kmers
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "kmers.bin")
+    ...     save_kmers(path, {27: 4, 3: 2, 300: 7}, 5)
+    ...     table = load_kmers(path)
+    ...     _ = table.pop(27)
+    ...     kmers, counts = _table_arrays(table)
+    ...     table.close()
+    >>> kmers.tolist(), counts.tolist()
+    ([3, 300], [2, 7])
+    """
+    kmers, counts, removed = table.buffers()
+    size = len(counts)
+    # The big endian kmers are padded to 8 bytes, then read as 64 bits integers
+    padded = np.zeros((size, 8), dtype=np.uint8)
+    padded[:, 8 - table.width:] = np.frombuffer(kmers, dtype=np.uint8).reshape(size, table.width)
+    kmers.release()
+    kept = np.unpackbits(np.frombuffer(removed, dtype=np.uint8), count=size, bitorder="little") == 0
+    return padded.view(">u8").ravel()[kept].astype(np.uint64), np.frombuffer(counts, dtype=np.uint32)[kept]
+
+
+def _contig_records(contigs: Iterable[Tuple[str, float]]) -> Iterator[Contig]:
+    """
+    Numbers contigs given with their mean kmers count, in the order they come.
+    """
+    for contig_num, (contig, coverage) in enumerate(contigs, 1):
+        yield Contig(f"contig_{contig_num}_len_{len(contig)}", contig, len(contig), coverage)
+
+
+def _merge_rounds(components_rounds: List[List[Dict[str, int]]]) -> List[Dict[str, int]]:
+    """
+    Sums the simplification statistics (see DBG.simplify) of several components, round by round.
+
+    Example:
+    >>> first = [{'round': 1, 'worklist': None, 'tips': 2}]
+    >>> second = [{'round': 1, 'worklist': None, 'tips': 1}, {'round': 2, 'worklist': 4, 'tips': 0}]
+    >>> _merge_rounds([first, second])
+    [{'round': 1, 'worklist': None, 'tips': 3}, {'round': 2, 'worklist': 4, 'tips': 0}]
+    """
+    merged = []
+    for rounds in components_rounds:
+        for statistics in rounds:
+            if statistics["round"] > len(merged):
+                merged.append(dict(statistics))
+                continue
+            total = merged[statistics["round"] - 1]
+            for key, value in statistics.items():
+                if key != "round" and value is not None:
+                    total[key] = (total[key] or 0) + value
+    return merged
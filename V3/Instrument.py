@@ -0,0 +1,336 @@
+# Instrumentation of the assembler stages
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter, process_time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Current and peak resident memory of the process, and the file resetting the peak (Linux)
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+# Number of functions and of allocation sites kept for each stage in the report
+_TOP = 10
+_MB = 1 << 20
+
+
+def _cpu_seconds() -> float:
+    """
+    Returns the CPU time of the process (all its threads) and of its terminated child processes.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _memory() -> Tuple[float, float]:
+    """
+    Returns the current and the peak resident memory of the process, in Mb (0 where /proc is
+    not available).
+    """
+    values = {}
+    try:
+        with open(_STATUS) as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    values[line[:5]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return values.get("VmRSS", 0.0), values.get("VmHWM", 0.0)
+
+
+def _reset_peak() -> None:
+    """
+    Resets the peak resident memory of the process to its current resident memory.
+    """
+    try:
+        with open(_CLEAR_REFS, "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def n50(lengths: Iterable[int]) -> int:
+    """
+    Returns the N50 of contigs: the length of the shortest contig such that the contigs at least
+    as long cover half of the total length.
+
+    Parameter:
+    lengths: The lengths of the contigs
+
+    Examples:
+    >>> n50([2, 3, 4, 5, 6])
+    5
+    >>> n50([10, 1, 1]), n50([])
+    (10, 0)
+    """
+    lengths = sorted(lengths, reverse=True)
+    half, covered = sum(lengths) / 2, 0
+    for length in lengths:
+        covered += length
+        if covered >= half:
+            return length
+    return 0
+
+
+def _top_functions(profiler: cProfile.Profile) -> List[Dict]:
+    """
+    Returns the functions in which a profiled stage spent the most time (not counting the
+    functions they call), the private methods of the classes keeping their mangled name
+    (_DBG__pop_bubbles).
+    """
+    stats = pstats.Stats(profiler).stats
+    functions = sorted(stats.items(), key=lambda item: -item[1][2])[:_TOP]
+    return [{"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+             "seconds": own, "cumulative_seconds": cumulative}
+            for (filename, line, name), (_, calls, own, cumulative, _) in functions]
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, start: tracemalloc.Snapshot) -> List[Dict]:
+    """
+    Returns the lines which allocated the most memory still held at the end of a stage.
+    """
+    # The allocations of the measure itself are left out
+    filters = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, cProfile, sys.modules[__name__])]
+    differences = snapshot.filter_traces(filters).compare_to(start.filter_traces(filters), "lineno")[:_TOP]
+    return [{"site": f"{os.path.basename(difference.traceback[0].filename)}:{difference.traceback[0].lineno}",
+             "mb": difference.size_diff / _MB, "blocks": difference.count_diff}
+            for difference in differences if difference.size_diff > 0]
+
+
+class RunReport:
+
+    def __init__(self, enabled: bool = True, profile_dir: Optional[str] = None, trace_memory: bool = False):
+        """
+        Records the wall time, the CPU time (of the process, its threads and its child processes),
+        the peak resident memory and counts of the stages of a run. A disabled report measures
+        nothing: its stages cost a function call.
+
+        Stages may also be profiled with cProfile (each stage in its own pstats file, readable with
+        python -m pstats or snakeviz) and their memory traced with tracemalloc. These modes slow the
+        run down and only apply to the current process (not to the counting and assembling
+        processes of -t).
+
+        Parameters:
+        enabled: If False, stage and iterate do not measure anything
+        profile_dir: If given, each stage is profiled and its statistics written in
+                     profile_dir/<stage>.pstats
+        trace_memory: If True, the Python and numpy allocations of each stage are traced
+
+        Example:
+        >>> report = RunReport()
+        >>> for _ in range(2):
+        ...     with report.stage("count") as counts:
+        ...         reads = list(report.iterate("parse", [b"ACGT", b"GA"], within="count", items="reads", size="bases"))
+        ...         counts["kmers"] = 3
+        >>> [(stage["stage"], stage["calls"], stage.get("kmers"), stage.get("reads"), stage.get("bases"))
+        ...  for stage in report.get_stages()]
+        [('count', 2, 6, None, None), ('parse', 2, None, 4, 12)]
+        >>> sorted(report.get_stages()[0])
+        ['calls', 'cpu_seconds', 'kmers', 'peak_rss_delta_mb', 'peak_rss_mb', 'stage', 'wall_seconds']
+        """
+        self.enabled = enabled
+        self.__stages: Dict[str, Dict] = {}
+        self.__wall = perf_counter()
+        self.__cpu = _cpu_seconds() if enabled else 0.0
+        self.__peak = _memory()[1] if enabled else 0.0
+        self.__profile_dir = profile_dir
+        self.__profiles: Dict[str, cProfile.Profile] = {}
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+        self.__trace_memory = enabled and trace_memory
+        if self.__trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __record(self, name: str) -> Dict:
+        """
+        Returns the record of a stage, created empty the first time.
+        """
+        if name not in self.__stages:
+            self.__stages[name] = {"stage": name, "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0}
+        return self.__stages[name]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, int]]:
+        """
+        Measures a stage of the run, the body of the with block. The counts put by the block in the
+        yielded dictionary are added to the ones of the stage: a stage run several times (in several
+        rounds) adds up. Its peak memory is the highest one of its runs, and the peak delta the
+        highest rise of the resident memory during one of them.
+
+        Parameter:
+        name: The name of the stage
+        """
+        counts = {}
+        if not self.enabled:
+            yield counts
+            return
+        record = self.__record(name)
+        rss, peak = _memory()
+        self.__peak = max(self.__peak, peak)
+        # The peak of the process is reset so that the one read at the end is the peak of this stage
+        _reset_peak()
+        if self.__trace_memory:
+            start_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        profiler = None
+        if self.__profile_dir:
+            profiler = self.__profiles.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        wall, cpu = perf_counter(), _cpu_seconds()
+        try:
+            yield counts
+        finally:
+            wall, cpu = perf_counter() - wall, _cpu_seconds() - cpu
+            if profiler:
+                profiler.disable()
+                # The statistics of all the runs of the stage are written again after each one
+                record["profile"] = os.path.join(self.__profile_dir, f"{name}.pstats")
+                profiler.dump_stats(record["profile"])
+                record["top_functions"] = _top_functions(profiler)
+            if self.__trace_memory:
+                self.__trace(record, start_snapshot, traced)
+            peak = _memory()[1]
+            self.__peak = max(self.__peak, peak)
+            record["calls"] += 1
+            record["wall_seconds"] += wall
+            record["cpu_seconds"] += cpu
+            record["peak_rss_mb"] = max(record.get("peak_rss_mb", 0.0), peak)
+            record["peak_rss_delta_mb"] = max(record.get("peak_rss_delta_mb", 0.0), peak - rss)
+            for key, value in counts.items():
+                record[key] = record.get(key, 0) + value
+
+    @staticmethod
+    def __trace(record: Dict, start_snapshot: tracemalloc.Snapshot, traced: int) -> None:
+        """
+        Splits the traced peak memory of a stage into the memory it still holds at its end
+        (retained) and the temporary structures freed before (temporary), and records the lines
+        which allocated the retained memory.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if peak - traced >= record.get("traced_peak_delta_mb", 0.0) * _MB:
+            record["traced_peak_delta_mb"] = (peak - traced) / _MB
+            record["traced_retained_mb"] = (current - traced) / _MB
+            record["traced_temporary_mb"] = (peak - current) / _MB
+            record["allocations"] = _top_allocations(tracemalloc.take_snapshot(), start_snapshot)
+
+    def attribute(self, name: str, structures: Dict[str, int]) -> None:
+        """
+        Records the memory held by each data structure built by a stage (see DBG.get_memory).
+
+        Parameters:
+        name: The name of the stage
+        structures: The size in bytes of each structure
+
+        Example:
+        >>> report = RunReport()
+        >>> report.attribute("graph", {"targets": 3 << 20, "sources": 1 << 20})
+        >>> report.get_stages()[0]["structures_mb"]
+        {'targets': 3.0, 'sources': 1.0}
+        """
+        if self.enabled:
+            self.__record(name)["structures_mb"] = {structure: size / _MB for structure, size in structures.items()}
+
+    def iterate(self, name: str, iterable: Iterable, within: Optional[str] = None, items: str = "items",
+                size: Optional[str] = None) -> Iterable:
+        """
+        Measures a stage run lazily inside another one (the reads parsed while they are counted,
+        the contigs extracted while they are written): the wall and CPU time (of the process) spent
+        producing the items of an iterable, which are counted.
+
+        Parameters:
+        name: The name of the stage
+        iterable: The items produced by the stage
+        within: The name of the stage consuming the items (its times include the ones of this stage)
+        items: The name of the count of the items
+        size: If given, the name of the sum of the lengths of the items
+
+        Returns:
+        An iterator of the same items (the iterable itself if the report is disabled)
+        """
+        if not self.enabled:
+            return iterable
+        record = self.__record(name)
+        record["calls"] += 1
+        record["within"] = within
+        record.setdefault(items, 0)
+        if size:
+            record.setdefault(size, 0)
+        return self.__iterate(record, iter(iterable), items, size)
+
+    @staticmethod
+    def __iterate(record: Dict, iterator: Iterator, items: str, size: Optional[str]) -> Iterator:
+        while True:
+            wall, cpu = perf_counter(), process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record["wall_seconds"] += perf_counter() - wall
+                record["cpu_seconds"] += process_time() - cpu
+            record[items] += 1
+            if size:
+                record[size] += len(item)
+            yield item
+
+    def contigs(self, records: Iterable[Tuple[str, str]], counts: Dict[str, int]) -> Iterable[Tuple[str, str]]:
+        """
+        Passes on the (name, sequence) records of the contigs being written, then puts their total
+        length ("bases") and their N50 in the counts of the writing stage.
+
+        Parameters:
+        records: The (name, sequence) records of the contigs
+        counts: The counts yielded by stage
+
+        Returns:
+        An iterator of the same records (the records themselves if the report is disabled)
+
+        Example:
+        >>> report = RunReport()
+        >>> with report.stage("write") as counts:
+        ...     names = [name for name, _ in report.contigs([("a", "ACGT"), ("b", "AC")], counts)]
+        >>> report.get_stages()[0]["bases"], report.get_stages()[0]["n50"]
+        (6, 4)
+        """
+        if not self.enabled:
+            return records
+        return self.__contigs(records, counts)
+
+    @staticmethod
+    def __contigs(records: Iterable[Tuple[str, str]], counts: Dict[str, int]) -> Iterator[Tuple[str, str]]:
+        lengths = []
+        for name, sequence in records:
+            lengths.append(len(sequence))
+            yield name, sequence
+        counts["bases"] = sum(lengths)
+        counts["n50"] = n50(lengths)
+
+    def get_stages(self) -> List[Dict]:
+        """
+        Returns the records of the stages, in the order they started.
+        """
+        return [dict(record) for record in self.__stages.values()]
+
+    def get_total(self) -> Dict[str, float]:
+        """
+        Returns the wall time, the CPU time and the peak resident memory of the whole run so far.
+        """
+        return {"wall_seconds": perf_counter() - self.__wall, "cpu_seconds": _cpu_seconds() - self.__cpu,
+                "peak_rss_mb": max(self.__peak, _memory()[1])}
+
+    def write(self, filename: str, parameters: Optional[Dict] = None) -> None:
+        """
+        Writes the report in a JSON file: the command line, the parameters of the run, the records
+        of the stages and the totals.
+
+        Parameters:
+        filename: The name of the JSON file
+        parameters: The parameters of the run (the arguments of Main.py)
+        """
+        with open(filename, "w") as out:
+            json.dump({"command": sys.argv, "parameters": parameters or {}, "stages": self.get_stages(),
+                       "total": self.get_total()}, out, indent=2)
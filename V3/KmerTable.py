@@ -0,0 +1,202 @@
+import mmap
+import struct
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, Tuple
+
+# Binary format of a kmer table:
+# - header: magic, version, k, filter threshold, flags (bit 0: canonical), number of kmers, bytes per kmer
+# - the packed kmers, sorted, each on a fixed number of bytes (big endian, so the bytes are sorted too)
+# - the counts, unsigned 32 bits integers in the same order
+_MAGIC = b"DBGKMERS"
+_VERSION = 1
+_HEADER = struct.Struct("<8sHIIIQI")
+_HEADER_SIZE = 64
+_CANONICAL = 1
+_MAX_COUNT = 0xFFFFFFFF
+
+
+def save_kmers(filename: str, kmers_dict: Dict[int, int], k: int, threshold: int = 1,
+               canonical: bool = False) -> None:
+    """
+    Writes a dictionary of packed kmers in the binary format read by load_kmers.
+
+    Parameters:
+    filename: The name of the file to write
+    kmers_dict: The dictionary of packed kmers and their counts
+    k: The size of the kmers
+    threshold: The filter threshold applied to the kmers (kept in the header)
+    canonical: If True, the kmers are canonical (kept in the header)
+    """
+    width = (2 * k + 7) // 8
+    kmers = sorted(kmers_dict)
+    header = _HEADER.pack(_MAGIC, _VERSION, k, threshold, _CANONICAL if canonical else 0, len(kmers), width)
+    with open(filename, "wb") as out:
+        out.write(header.ljust(_HEADER_SIZE, b"\0"))
+        for kmer in kmers:
+            out.write(kmer.to_bytes(width, "big"))
+        counts = array("I", (min(kmers_dict[kmer], _MAX_COUNT) for kmer in kmers))
+        if counts.itemsize != 4:
+            raise RuntimeError("Unsigned int must be 32 bits long to write the counts")
+        out.write(counts.tobytes())
+
+
+def load_kmers(filename: str) -> "KmerTable":
+    """
+    Maps a kmer table written by save_kmers. Nothing is read until a kmer is accessed, and the pages
+    of the file are shared by every process mapping it.
+
+    Parameter:
+    filename: The name of the file to map
+
+    Returns:
+    A KmerTable, usable as the kmers dictionary of DBG
+
+    Raises:
+    ValueError: if the file is not a kmer table
+
+    Examples:
+    >>> import os, tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "kmers.bin")
+    ...     save_kmers(path, {27: 4, 3: 2, 200: 7}, 4, threshold=2)
+    ...     table = load_kmers(path)
+    ...     print(table.k, table.threshold, table.canonical, len(table), dict(table))
+    ...     print(27 in table, 28 in table, table[200], table.pop(3), len(table), list(table))
+    ...     table.close()
+    4 2 False 3 {3: 2, 27: 4, 200: 7}
+    True False 7 2 2 [27, 200]
+    """
+    return KmerTable(filename)
+
+
+class KmerTable(Mapping):
+
+    def __init__(self, filename: str):
+        """
+        Parameter:
+        filename: The name of a file written by save_kmers
+        """
+        with open(filename, "rb") as file:
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.__map) < _HEADER_SIZE:
+            raise ValueError(f"Not a kmer table: '{filename}'")
+        magic, version, k, threshold, flags, size, width = _HEADER.unpack_from(self.__map)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Not a kmer table: '{filename}'")
+        self.k = k
+        self.threshold = threshold
+        self.canonical = bool(flags & _CANONICAL)
+        # Number of bytes of each packed kmer
+        self.width = width
+        self.__size = size
+        self.__width = width
+        counts_start = _HEADER_SIZE + size * width
+        self.__counts = memoryview(self.__map)[counts_start:counts_start + 4 * size].cast("I")
+        # The file is read only: removed kmers are marked in a bitmap
+        self.__removed = bytearray((size + 7) // 8)
+        self.__removed_count = 0
+
+    def __kmer_at(self, index: int) -> bytes:
+        start = _HEADER_SIZE + index * self.__width
+        return self.__map[start:start + self.__width]
+
+    def __is_removed(self, index: int) -> bool:
+        return bool(self.__removed[index >> 3] & (1 << (index & 7)))
+
+    def __index(self, kmer: int) -> int:
+        """
+        Returns the index of a kmer by binary search, -1 if absent or removed.
+        """
+        if not isinstance(kmer, int) or kmer < 0 or kmer.bit_length() > 8 * self.__width:
+            return -1
+        key = kmer.to_bytes(self.__width, "big")
+        low, high = 0, self.__size
+        while low < high:
+            middle = (low + high) // 2
+            if self.__kmer_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.__size and self.__kmer_at(low) == key and not self.__is_removed(low):
+            return low
+        return -1
+
+    def __getitem__(self, kmer: int) -> int:
+        index = self.__index(kmer)
+        if index < 0:
+            raise KeyError(kmer)
+        return self.__counts[index]
+
+    def __contains__(self, kmer) -> bool:
+        return self.__index(kmer) >= 0
+
+    def __len__(self) -> int:
+        return self.__size - self.__removed_count
+
+    def __iter__(self) -> Iterator[int]:
+        for index, _ in self.__entries():
+            yield int.from_bytes(self.__kmer_at(index), "big")
+
+    def __entries(self) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the (index, count) of the kmers not removed.
+        """
+        for index in range(self.__size):
+            if not self.__is_removed(index):
+                yield index, self.__counts[index]
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        for index, count in self.__entries():
+            yield int.from_bytes(self.__kmer_at(index), "big"), count
+
+    def values(self) -> Iterator[int]:
+        for _, count in self.__entries():
+            yield count
+
+    def buffers(self) -> Tuple[memoryview, memoryview, bytes]:
+        """
+        Gives the raw content of the table, to read it at once (with numpy) instead of kmer by kmer.
+
+        Returns:
+        The packed kmers (width bytes each, big endian), their counts and the bitmap of the removed
+        kmers (bit index & 7 of byte index >> 3)
+
+        Example:
+        >>> import os, tempfile
+        >>> with tempfile.TemporaryDirectory() as directory:
+        ...     path = os.path.join(directory, "kmers.bin")
+        ...     save_kmers(path, {27: 4, 3: 2, 300: 7}, 5)
+        ...     table = load_kmers(path)
+        ...     _ = table.pop(27)
+        ...     kmers, counts, removed = table.buffers()
+        ...     print(table.width, kmers.tobytes(), counts.tolist(), removed)
+        ...     kmers.release()
+        ...     table.close()
+        2 b'\\x00\\x03\\x00\\x1b\\x01,' [2, 4, 7] b'\\x02'
+        """
+        kmers = memoryview(self.__map)[_HEADER_SIZE:_HEADER_SIZE + self.__size * self.__width]
+        return kmers, self.__counts, bytes(self.__removed)
+
+    def pop(self, kmer: int, *default) -> int:
+        """
+        Removes a kmer from the table (the file is left untouched) and returns its count.
+        """
+        index = self.__index(kmer)
+        if index < 0:
+            if default:
+                return default[0]
+            raise KeyError(kmer)
+        self.__removed[index >> 3] |= 1 << (index & 7)
+        self.__removed_count += 1
+        return self.__counts[index]
+
+    def __delitem__(self, kmer: int) -> None:
+        self.pop(kmer)
+
+    def close(self) -> None:
+        """
+        Unmaps the file.
+        """
+        self.__counts.release()
+        self.__map.close()
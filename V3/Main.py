@@ -1,27 +1,51 @@
 # Import the needed modules to the main
 import argparse
-from collections import defaultdict
+from functools import partial
 from time import time
 
 # Import needed functions to file reading and kmers extraction
 from Script import *
 
+# Import needed functions to save and map kmers tables
+from KmerTable import *
+
 # Import needed methods to create the DeBruijn graph
 from DBG import *
 
+# Import the measure of the stages of the run
+from Instrument import RunReport
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     # Files parameters
-    parser.add_argument("-r", "--reads_file", required=True, type = str, 
+    parser.add_argument("-r", "--reads_file", required=False, type = str, 
                         help = "Reads the assembler will work on")
     parser.add_argument("-o", "--outfile", required = False, type = str, 
-                        help = "Output file name with contigs abtained with the assembler")
+                        help = "Output file name with contigs abtained with the assembler (compressed in BGZF if it ends with .gz)")
+    parser.add_argument("--save-kmers", required=False, type=str,
+                        help = "Save the filtered kmers table in this binary file")
+    parser.add_argument("--load-kmers", required=False, type=str,
+                        help = "Map a kmers table saved with --save-kmers instead of reading the reads file")
+    parser.add_argument("--report", required=False, type=str,
+                        help = "Write the time, memory and counts of each stage of the run in this JSON file")
+    parser.add_argument("--profile", required=False, type=str,
+                        help = "Profile each stage with cProfile and write its statistics in this directory (<stage>.pstats)")
+    parser.add_argument("--trace-memory", required=False, action='store_true',
+                        help = "Trace the allocations of each stage with tracemalloc and add them to the --report file")
     
     # kmers parameters
-    parser.add_argument("-k", "--kmers_length", required = True, type = int, 
-                        help = "Length of kmers to extract")
+    parser.add_argument("-k", "--kmers_length", required = False, type = int, 
+                        help = "Length of kmers to extract (required unless --load-kmers is given)")
     parser.add_argument("-kf", "--kmers_filter_threshold", required=False, type = int, 
                         help = "Abundance minimal of kmers for them to being kept")
+    parser.add_argument("-t", "--threads", required=False, type=int, default=1,
+                        help = "Number of processes used to count kmers and to assemble the connected components of the graph")
+    parser.add_argument("-c", "--canonical", required=False, action='store_true',
+                        help = "Fold each kmer with its reverse complement (strand-neutral kmers)")
+    parser.add_argument("-b", "--bloom_size", required=False, type=int,
+                        help = "Size (in Mb) of the Bloom filters keeping kmers seen less than -kf times out of the count (their estimated false positive rates are printed)")
+    parser.add_argument("-m", "--max-memory", required=False, type=int,
+                        help = "Count kmers out of core, through temporary files, with this memory budget (in Mb)")
     parser.add_argument("-kh", "--kmers_abundance_hist", required= False, action='store_true', 
                         help="Construct Kmers abundance histogram")
     
@@ -30,10 +54,24 @@ if __name__ == '__main__':
                         help = "Si présent assemble")
     parser.add_argument("-tt", "--tip_threshold", required=False, type=int,
                         help = "Max length of an alternative path to be considered as a tip")
+    parser.add_argument("-bl", "--bubble_length", required=False, type=int,
+                        help = "Max length (in nodes) of a bubble branch (default: 1500)")
+    parser.add_argument("-bv", "--bubble_visited", required=False, type=int,
+                        help = "Max number of nodes explored from each branching node to find bubbles (default: 10 * -bl)")
+    parser.add_argument("-sr", "--simplify_rounds", required=False, type=int,
+                        help = "Max number of tips and bubbles removal rounds (default: 10)")
+    parser.add_argument("-u", "--compacted", required=False, action='store_true',
+                        help = "Remove tips and bubbles (one pass each, -bl, -bv and -sr do not apply) and extract contigs on the compacted (unitig) graph")
 
     args = parser.parse_args()
 
-    if args.kmers_length <=0:
+    if not args.reads_file and not args.load_kmers:
+        raise ValueError("Un fichier de reads (-r) ou une table de kmers (--load-kmers) est nécessaire.")
+
+    if args.kmers_length is None and not args.load_kmers:
+        raise ValueError("La taille des kmers (-k) est nécessaire.")
+
+    if args.kmers_length is not None and args.kmers_length <=0:
         raise ValueError("La taille des kmers doit être supérieure à 0.")
 
     if args.kmers_filter_threshold is not None and args.kmers_filter_threshold <=0:
@@ -42,48 +80,129 @@ if __name__ == '__main__':
     if args.tip_threshold is not None and args.tip_threshold <=0:
         raise ValueError(" Le seuil pour -tt doit être strictement positif.")
 
+    if args.simplify_rounds is not None and args.simplify_rounds <= 0:
+        raise ValueError(" Le nombre de tours pour -sr doit être strictement positif.")
+
+    for bubble_limit in (args.bubble_length, args.bubble_visited):
+        if bubble_limit is not None and bubble_limit <= 0:
+            raise ValueError(" Les limites -bl et -bv doivent être strictement positives.")
+
+    if args.compacted and (args.bubble_length, args.bubble_visited, args.simplify_rounds) != (None, None, None):
+        raise ValueError(" Les options -bl, -bv et -sr ne s'appliquent pas au graphe compacté (-u).")
+
+    if args.threads <= 0:
+        raise ValueError(" Le nombre de processus pour -t doit être strictement positif.")
+
+    if args.bloom_size is not None:
+        if args.bloom_size <= 0:
+            raise ValueError(" La taille pour -b doit être strictement positive.")
+        if not args.kmers_filter_threshold or args.kmers_filter_threshold < 2:
+            raise ValueError(" Les filtres de Bloom (-b) nécessitent un seuil -kf d'au moins 2.")
+        if args.threads > 1:
+            raise ValueError(" Les filtres de Bloom (-b) ne peuvent pas être utilisés avec -t.")
+
+    if args.max_memory is not None:
+        if args.max_memory <= 0:
+            raise ValueError(" La mémoire pour --max-memory doit être strictement positive.")
+        if args.threads > 1 or args.bloom_size:
+            raise ValueError(" Le comptage sur disque (--max-memory) ne peut pas être utilisé avec -t ou -b.")
+
+    if args.report and not args.report.endswith(".json"):
+        raise ValueError("Le rapport (--report) doit comporter l'extension '.json'")
+
+    if args.trace_memory and not args.report:
+        raise ValueError("Le traçage de la mémoire (--trace-memory) nécessite un rapport (--report).")
+
     start = time()
-    f = read_gz(args.reads_file)
+    report = RunReport(enabled=bool(args.report or args.profile), profile_dir=args.profile,
+                       trace_memory=args.trace_memory)
+    # The reads are parsed lazily, while their kmers are counted
+    reads_hook = partial(report.iterate, "parse", within="count", items="reads", size="bases")
+    bloom_filters = None
+    if args.bloom_size:
+        bloom_filters = bloom_cascade(args.kmers_filter_threshold, args.bloom_size * 8_000_000)
 
-    kmers_dict = defaultdict(int)
-    for seq in f:
-        for kmer, count in kmers(str(seq.seq), args.kmers_length).items():
-            kmers_dict[kmer] += count
+    # Threshold already applied to the loaded kmers
+    table_threshold = 1
+    if args.load_kmers:
+        # The table is mapped, not read: its pages are shared with other processes
+        with report.stage("load") as counts:
+            kmers_dict = load_kmers(args.load_kmers)
+            counts["kmers"] = len(kmers_dict)
+        table_threshold = kmers_dict.threshold
+        if args.kmers_length is not None and args.kmers_length != kmers_dict.k:
+            raise ValueError(f"La table de kmers contient des kmers de taille {kmers_dict.k}.")
+        args.kmers_length = kmers_dict.k
+        args.canonical = kmers_dict.canonical
+    elif args.max_memory:
+        # Kmers are already filtered bucket per bucket
+        with report.stage("count") as counts:
+            kmers_dict = count_reads_kmers_disk(args.reads_file, args.kmers_length, args.max_memory * 1_000_000,
+                                                args.kmers_filter_threshold or 1, args.canonical,
+                                                reads_hook=reads_hook)
+            counts["kmers"] = len(kmers_dict)
+    else:
+        with report.stage("count") as counts:
+            kmers_dict = count_reads_kmers(args.reads_file, args.kmers_length, args.threads,
+                                           canonical=args.canonical, bloom_filters=bloom_filters,
+                                           reads_hook=reads_hook)
+            counts["kmers"] = len(kmers_dict)
+
+    if bloom_filters:
+        rates = ", ".join(f"{bloom.false_positive_rate():.2e}" for bloom in bloom_filters)
+        print(f"Bloom filters estimated false positive rates (fill ratio ** hashes) : {rates}")
 
     if not kmers_dict:
         raise ValueError("Aucun kmer n'a pu être extrait, vérifiez le fichier ou la valeur de k")
     
     # Creation of abundance histogram of kmers
     if args.kmers_abundance_hist:
-        abundance_hist(kmers_dict)
+        with report.stage("histogram"):
+            abundance_hist(kmers_dict)
 
-    if args.kmers_filter_threshold:
-        f_kmers = kmers_filter(kmers_dict, args.kmers_filter_threshold)
+    if args.kmers_filter_threshold and not args.max_memory and args.kmers_filter_threshold > table_threshold:
+        with report.stage("filter") as counts:
+            f_kmers = kmers_filter(kmers_dict, args.kmers_filter_threshold)
+            counts.update(kmers_before=len(kmers_dict), kmers_after=len(f_kmers))
         kmers_dict = f_kmers
 
     print("Kmers dictionnary generated")
 
+    if args.save_kmers:
+        threshold = max(args.kmers_filter_threshold or 1, table_threshold)
+        with report.stage("save") as counts:
+            save_kmers(args.save_kmers, kmers_dict, args.kmers_length, threshold, args.canonical)
+            counts["kmers"] = len(kmers_dict)
+        print(f"{args.save_kmers} was generated")
+
     if args.assembler:
-        dbg = DBG(kmers_dict)
+        with report.stage("graph") as counts:
+            dbg = DBG(kmers_dict, args.kmers_length, args.canonical)
+            counts["nodes"], counts["edges"] = dbg.get_size()
+        if report.enabled:
+            # get_memory walks the kmers for k > 32: only run it for a report
+            report.attribute("graph", dbg.get_memory())
         print("DeBruijn graph generated")
         
+        if args.outfile and not args.outfile.endswith((".fa", ".fasta", ".fa.gz", ".fasta.gz")):
+            raise ValueError("Le fichier doit comporter l'extension '.fa' ou '.fasta' (suivie de '.gz' pour le compresser)")
+
         # Management of optional arguments
-        # 2 arguments present
-        if args.outfile and args.tip_threshold:
-            dbg.get_all_contigs(args.outfile, args.tip_threshold)
-        
-        if args.outfile and not args.outfile.endswith((".fa", ".fasta")):
-            raise ValueError("Le fichier doit comporter l'extension '.fa' ou '.fasta")
-
-        # 1 argument present
-        elif args.outfile: 
-            dbg.get_all_contigs(args.outfile)
-        elif args.tip_threshold:
-            dbg.get_all_contigs(tip_threshold=args.tip_threshold)
-        
-        # 0 argument present
-        else:
-            dbg.get_all_contigs()
+        options = {}
+        if args.outfile:
+            options["output_file"] = args.outfile
+        if args.tip_threshold:
+            options["tip_threshold"] = args.tip_threshold
+        if args.simplify_rounds:
+            options["max_rounds"] = args.simplify_rounds
+        dbg.get_all_contigs(**options, compacted=args.compacted, bubble_length=args.bubble_length,
+                            bubble_visited=args.bubble_visited, threads=args.threads, report=report)
 
         end = time()
-        print(f"Execution time : {end-start}\n")
\ No newline at end of file
+        print(f"Execution time : {end-start}\n")
+
+    if args.report:
+        report.write(args.report, vars(args))
+        print(f"{args.report} was generated")
+    if args.profile:
+        print(f"Profiles of the stages were generated in {args.profile}")
\ No newline at end of file
@@ -1,13 +1,81 @@
 #Import des modules nécessaires au fonctionnement du script
 import gzip
-from Bio import SeqIO   
-from collections import defaultdict
-from typing import Dict
-from matplotlib import pyplot as plt
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
+import threading
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-def read_gz(filename: str):
+from BloomFilter import BloomFilter, bloom_cascade
+
+# Kmers are packed on 2 bits per nucleotide (A=0, C=1, G=2, T=3), first base on the most significant bits
+NUCLEOTIDES = "ACGT"
+_ENCODE_TABLE = str.maketrans("ACGTacgt", "01230123")
+_COMPLEMENT_TABLE = str.maketrans("ACGT", "TGCA")
+_DECODE_TABLE = str.maketrans({format(i, 'x'): NUCLEOTIDES[i >> 2] + NUCLEOTIDES[i & 3] for i in range(16)})
+_BASE_CODES = [-1] * 256
+_ACGT_FRAGMENTS = re.compile(b"[ACGTacgt]+")
+# Multiplier spreading the minimizers order, so that poly-A mmers do not gather every super-kmer
+_MINIMIZER_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+# Maximum number of bucket files opened at once by the disk counting
+_MAX_PARTITIONS = 512
+# Size of the blocks read at once by the parsers
+_BLOCK_SIZE = 1 << 20
+# Number of decompressed blocks waiting between the reading thread and the parser
+_QUEUE_SIZE = 8
+# Seconds between two checks of the counting processes while waiting on their queues
+_WORKERS_POLL = 1.0
+# Number of BGZF blocks (64 kb each at most) inflated together by a thread
+_BGZF_GROUP = 16
+# Maximum number of bytes compressed in a BGZF block (so that the compressed block fits in 64 kb)
+_BGZF_BLOCK_INPUT = 0xFF00
+# Empty BGZF block marking the end of a BGZF file
+_BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+_GZIP_MAGIC = b"\x1f\x8b"
+FASTQ_EXTENSIONS = ('.fastq', '.fq', '.fastq.gz', '.fq.gz')
+FASTA_EXTENSIONS = ('.fasta', '.fna', '.fa', '.fasta.gz', '.fna.gz', '.fa.gz')
+for _code, _base in enumerate(NUCLEOTIDES):
+    _BASE_CODES[ord(_base)] = _BASE_CODES[ord(_base.lower())] = _code
+
+def read_gz(filename: str, qualities: bool = False) -> Iterator[Union[bytes, Tuple[bytes, Optional[bytes]]]]:
         """
         Open a Fasta or FastQ file, compressed (.gz) or not, in reading mode and returns sequence's iterator.
+        The file is read by large blocks of bytes and parsed without building a record object per read.
+
+        Parameters:
+        filename: the name of the file to work on
+        qualities: If True, (sequence, quality) tuples are yielded (quality is None for a Fasta file)
+
+        Returns:
+        An iterator of the sequences, as bytes
+
+        Raises:
+        ValueError: if file format isn't supported
+        """
+        if filename.endswith(FASTQ_EXTENSIONS):
+            parser = parse_fastq
+        elif filename.endswith(FASTA_EXTENSIONS):
+            parser = parse_fasta
+        else:  
+            raise ValueError(f"file format not supported: '{filename}'")
+
+        # Decompression runs in a background thread, the parsing (and counting) in this one
+        records = parser(read_blocks(filename))
+        if parser is parse_fastq:
+            yield from (records if qualities else (sequence for sequence, _ in records))
+        else:
+            yield from (((sequence, None) for sequence in records) if qualities else records)
+
+def read_records(filename: str):
+        """
+        Open a Fasta or FastQ file with Biopython and returns an iterator of SeqRecord objects.
+        Biopython is an optional dependency, only needed by this function.
 
         Parameter:
         filename: the name of the file to work on
@@ -15,19 +83,488 @@ def read_gz(filename: str):
         Raises:
         ValueError: if file format isn't supported
         """
-        #Define the correct open function wether the file is compressed or not
+        from Bio import SeqIO
+
         open_func = gzip.open if filename.endswith(".gz") else open  
 
         with open_func(filename, "rt") as file:
-            # Open FastQ file
-            if filename.endswith(('.fastq', '.fq', '.fastq.gz', '.fq.gz')):  
+            if filename.endswith(FASTQ_EXTENSIONS):  
                 yield from SeqIO.parse(file, 'fastq')
-            # Open FastA file    
-            elif filename.endswith(('.fasta', '.fna', '.fa', '.fasta.gz', '.fna.gz', '.fa.gz')):
+            elif filename.endswith(FASTA_EXTENSIONS):
                 yield from SeqIO.parse(file, 'fasta')
             else:  
                 raise ValueError(f"file format not supported: '{filename}'")
-            
+
+def _read_blocks(file: BinaryIO, block_size: int = _BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Reads a binary file by blocks of block_size bytes.
+    """
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        yield block
+
+def read_blocks(filename: str, threads: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Reads the (decompressed) content of a file by blocks. The file is read and decompressed by a
+    background thread (zlib releases the GIL) and the blocks are handed over through a bounded queue.
+    BGZF files (blocked gzip) are inflated in parallel by several threads.
+
+    Parameters:
+    filename: the name of the file to read, compressed (.gz) or not
+    threads: The number of threads inflating BGZF blocks (number of CPUs if not given)
+
+    Returns:
+    An iterator of blocks of bytes
+
+    Examples:
+    >>> import tempfile, gzip
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "reads.fa.gz")
+    ...     with gzip.open(path, "wb") as out:
+    ...         _ = out.write(b">r1\\nACGT\\n")
+    ...     with gzip.open(path, "ab") as out:
+    ...         _ = out.write(b">r2\\nTTGA\\n")
+    ...     b"".join(read_blocks(path))
+    b'>r1\\nACGT\\n>r2\\nTTGA\\n'
+    """
+    if not filename.endswith(".gz"):
+        blocks = _raw_blocks(filename)
+    elif _is_bgzf(filename):
+        blocks = _bgzf_blocks(filename, threads or os.cpu_count() or 1)
+    else:
+        blocks = _gzip_blocks(filename)
+    return _background(blocks)
+
+def _background(blocks: Iterator[bytes], queue_size: int = _QUEUE_SIZE) -> Iterator[bytes]:
+    """
+    Runs a blocks iterator in a background thread and yields its blocks, at most queue_size blocks
+    being produced in advance. Exceptions of the background thread are raised in the caller.
+    """
+    handoff = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        # Waits for room in the queue unless the consumer has stopped
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for block in blocks:
+                if not put(block):
+                    return
+            put(end)
+        except BaseException as error:
+            put(error)
+        finally:
+            blocks.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is end:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def _raw_blocks(filename: str) -> Iterator[bytes]:
+    """
+    Reads an uncompressed file by blocks.
+    """
+    with open(filename, "rb") as file:
+        yield from _read_blocks(file)
+
+def _gzip_blocks(filename: str) -> Iterator[bytes]:
+    """
+    Reads and inflates a gzip file (possibly made of several members) by blocks.
+
+    Raises:
+    EOFError: if the file is truncated
+    """
+    with open(filename, "rb") as file:
+        inflater = zlib.decompressobj(wbits=31)
+        # True while the current member has been started but not finished
+        started = False
+        for chunk in _read_blocks(file):
+            while chunk:
+                started = True
+                block = inflater.decompress(chunk)
+                if block:
+                    yield block
+                chunk = b""
+                if inflater.eof:
+                    # A new gzip member may start right after the end of this one
+                    chunk = inflater.unused_data.lstrip(b"\x00")
+                    inflater = zlib.decompressobj(wbits=31)
+                    started = False
+        if started:
+            raise EOFError(f"Compressed file ended before the end-of-stream marker was reached: '{filename}'")
+
+def _is_bgzf(filename: str) -> bool:
+    """
+    Tells if a gzip file is a BGZF file: its first member has a 'BC' extra subfield holding the block size.
+    """
+    with open(filename, "rb") as file:
+        header = file.read(12)
+        if len(header) < 12 or header[:2] != _GZIP_MAGIC or not header[3] & 4:
+            return False
+        return _bgzf_block_size(file.read(int.from_bytes(header[10:12], "little"))) is not None
+
+def _bgzf_block_size(extra: bytes) -> Optional[int]:
+    """
+    Returns the total size of a BGZF block from the extra field of its header (None if not BGZF).
+    """
+    pos = 0
+    while pos + 4 <= len(extra):
+        length = int.from_bytes(extra[pos + 2:pos + 4], "little")
+        if extra[pos:pos + 2] == b"BC" and length == 2:
+            return int.from_bytes(extra[pos + 4:pos + 6], "little") + 1
+        pos += 4 + length
+    return None
+
+def _bgzf_payloads(file: BinaryIO) -> Iterator[Tuple[bytes, int]]:
+    """
+    Reads the BGZF blocks of a file and yields their raw deflate data with their CRC32.
+
+    Raises:
+    ValueError: if a block is not a BGZF block
+    """
+    while True:
+        header = file.read(12)
+        if not header:
+            return
+        xlen = int.from_bytes(header[10:12], "little")
+        extra = file.read(xlen)
+        block_size = _bgzf_block_size(extra) if header[:2] == _GZIP_MAGIC and len(header) == 12 else None
+        if block_size is None:
+            raise ValueError("Invalid BGZF block")
+        rest = file.read(block_size - 12 - xlen)
+        yield rest[:-8], int.from_bytes(rest[-8:-4], "little")
+
+def _inflate_bgzf(payloads: List[Tuple[bytes, int]]) -> bytes:
+    """
+    Inflates a group of BGZF blocks and checks their CRC32.
+
+    Raises:
+    ValueError: if a block is corrupted
+    """
+    blocks = []
+    for data, crc in payloads:
+        block = zlib.decompress(data, wbits=-15)
+        if zlib.crc32(block) != crc:
+            raise ValueError("CRC check failed for a BGZF block")
+        blocks.append(block)
+    return b"".join(blocks)
+
+def _bgzf_blocks(filename: str, threads: int) -> Iterator[bytes]:
+    """
+    Reads a BGZF file and inflates its blocks in parallel, by groups, keeping their order.
+    """
+    with open(filename, "rb") as file, ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        group = []
+        for payload in _bgzf_payloads(file):
+            group.append(payload)
+            if len(group) < _BGZF_GROUP:
+                continue
+            pending.append(pool.submit(_inflate_bgzf, group))
+            group = []
+            # Bounds the number of groups read in advance
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        if group:
+            pending.append(pool.submit(_inflate_bgzf, group))
+        while pending:
+            yield pending.popleft().result()
+
+def write_fasta(filename: str, records: Iterable[Tuple[str, str]], threads: Optional[int] = None,
+                line_width: int = 60) -> int:
+    """
+    Writes sequences in a Fasta file, wrapped on line_width columns. The records are formatted by
+    blocks of about 1 Mb, handed over through a bounded queue to a background thread which writes
+    them. Files ending with .gz are written in BGZF (blocked gzip, readable by gzip and read_blocks),
+    their blocks being compressed in parallel by several threads (zlib releases the GIL).
+
+    Parameters:
+    filename: the name of the file to write, compressed if it ends with .gz
+    records: An iterable of (name, sequence) couples
+    threads: The number of threads compressing BGZF blocks (number of CPUs if not given)
+    line_width: The maximum number of nucleotides per line
+
+    Returns:
+    The number of written sequences
+
+    Examples:
+    >>> import tempfile, gzip
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "contigs.fa.gz")
+    ...     write_fasta(path, [("c1", "ACGTACGT"), ("c2", "TTGA")], line_width=5)
+    ...     with gzip.open(path, "rt") as file:
+    ...         print(file.read(), end="")
+    ...     _is_bgzf(path), list(read_gz(path))
+    2
+    >c1
+    ACGTA
+    CGT
+    >c2
+    TTGA
+    (True, [b'ACGTACGT', b'TTGA'])
+    """
+    def formatted() -> Iterator[str]:
+        for name, sequence in records:
+            if len(sequence) > line_width:
+                sequence = "\n".join([sequence[i:i + line_width] for i in range(0, len(sequence), line_width)])
+            yield f">{name}\n{sequence}\n"
+
+    return _write_records(filename, formatted(), threads)
+
+def write_fastq(filename: str, records: Iterable[Tuple[str, str, str]], threads: Optional[int] = None) -> int:
+    """
+    Writes reads in a FastQ file (4 lines per read), in the background and compressed in BGZF if
+    the name of the file ends with .gz (see write_fasta).
+
+    Parameters:
+    filename: the name of the file to write, compressed if it ends with .gz
+    records: An iterable of (name, sequence, quality) tuples
+    threads: The number of threads compressing BGZF blocks (number of CPUs if not given)
+
+    Returns:
+    The number of written reads
+
+    Example:
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, "reads.fq.gz")
+    ...     write_fastq(path, [("r1", "ACGT", "II#I"), ("r2", "TTGA", "IIII")])
+    ...     list(read_gz(path, qualities=True))
+    2
+    [(b'ACGT', b'II#I'), (b'TTGA', b'IIII')]
+    """
+    return _write_records(filename, (f"@{name}\n{sequence}\n+\n{quality}\n" for name, sequence, quality in records),
+                          threads)
+
+def _write_records(filename: str, records: Iterator[str], threads: Optional[int]) -> int:
+    """
+    Writes formatted records in a file. They are gathered in blocks of about 1 Mb, handed over
+    through a bounded queue to a background thread which writes them (see _write_blocks).
+
+    Returns:
+    The number of written records
+    """
+    handoff = queue.Queue(maxsize=_QUEUE_SIZE)
+    errors = []
+    end = object()
+
+    def put(item) -> bool:
+        # Waits for room in the queue unless the writer has failed
+        while not errors:
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def consume() -> None:
+        try:
+            _write_blocks(filename, iter(handoff.get, end), threads or os.cpu_count() or 1)
+        except BaseException as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    count = 0
+    try:
+        parts = []
+        size = 0
+        for record in records:
+            parts.append(record)
+            count += 1
+            size += len(record)
+            if size >= _BLOCK_SIZE:
+                if not put("".join(parts).encode()):
+                    break
+                parts = []
+                size = 0
+        if parts:
+            put("".join(parts).encode())
+    finally:
+        # The file is closed even if the records failed
+        put(end)
+        thread.join()
+    if errors:
+        raise errors[0]
+    return count
+
+def _write_blocks(filename: str, blocks: Iterator[bytes], threads: int) -> None:
+    """
+    Writes blocks of bytes in a file, compressed in BGZF if its name ends with .gz.
+    """
+    if filename.endswith(".gz"):
+        blocks = _bgzf_compress(blocks, threads)
+    with open(filename, "wb") as out:
+        for block in blocks:
+            out.write(block)
+
+def _deflate_bgzf(data: bytes) -> bytes:
+    """
+    Compresses data as consecutive BGZF blocks: gzip members of at most 64 kb, whose header holds
+    their size in a 'BC' extra subfield.
+
+    Example:
+    >>> import gzip
+    >>> data = bytes(range(256)) * 1000
+    >>> gzip.decompress(_deflate_bgzf(data)) == data, _bgzf_block_size(_deflate_bgzf(b"ACGT")[12:18])
+    (True, 32)
+    """
+    blocks = []
+    view = memoryview(data)
+    for start in range(0, len(data), _BGZF_BLOCK_INPUT):
+        block = view[start:start + _BGZF_BLOCK_INPUT]
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        deflated = compressor.compress(block) + compressor.flush()
+        blocks.append(b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+                      + (len(deflated) + 25).to_bytes(2, "little") + deflated
+                      + zlib.crc32(block).to_bytes(4, "little") + len(block).to_bytes(4, "little"))
+    return b"".join(blocks)
+
+def _bgzf_compress(blocks: Iterator[bytes], threads: int) -> Iterator[bytes]:
+    """
+    Cuts blocks of bytes into BGZF blocks and compresses them in parallel, by groups, keeping their
+    order. The end-of-file marker block is yielded last.
+    """
+    group_size = _BGZF_GROUP * _BGZF_BLOCK_INPUT
+    with ThreadPoolExecutor(threads) as pool:
+        pending = deque()
+        rest = b""
+        for block in blocks:
+            data = rest + block
+            # Only full BGZF blocks are compressed, the rest waits for the next block
+            full = len(data) - len(data) % _BGZF_BLOCK_INPUT
+            for start in range(0, full, group_size):
+                pending.append(pool.submit(_deflate_bgzf, data[start:min(start + group_size, full)]))
+            rest = data[full:]
+            # Bounds the number of groups compressed in advance
+            while len(pending) >= 2 * threads:
+                yield pending.popleft().result()
+        if rest:
+            pending.append(pool.submit(_deflate_bgzf, rest))
+        while pending:
+            yield pending.popleft().result()
+    yield _BGZF_EOF
+
+def parse_fasta(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Parses the sequences of a (multi-line) Fasta content given by blocks of bytes.
+    Records may be split anywhere between two blocks.
+
+    Parameter:
+    blocks: The content of the file, by blocks
+
+    Returns:
+    An iterator of the sequences, as bytes
+
+    Raises:
+    ValueError: if the content does not start with a header
+
+    Examples:
+    >>> list(parse_fasta([b">r1\\nACG\\nTT\\n>r", b"2 desc\\nGGA\\r\\n", b"C\\n"]))
+    [b'ACGTT', b'GGAC']
+    >>> list(parse_fasta([b">r1\\n", b">r2\\nA"]))
+    [b'', b'A']
+    """
+    parts = []
+    for block in blocks:
+        end = block.rfind(b"\n>")
+        if end < 0:
+            parts.append(block)
+            continue
+        parts.append(block[:end])
+        yield from _fasta_sequences(b"".join(parts))
+        # The next record starts at the '>' of the last header found
+        parts = [block[end + 1:]]
+    data = b"".join(parts)
+    if data.strip():
+        yield from _fasta_sequences(data)
+
+def _fasta_sequences(data: bytes) -> Iterator[bytes]:
+    """
+    Yields the sequences of complete Fasta records, data starting with a '>'.
+    """
+    data = data.lstrip()
+    if not data.startswith(b">"):
+        raise ValueError("Fasta content must start with a '>' header")
+    for record in data[1:].split(b"\n>"):
+        header_end = record.find(b"\n")
+        if header_end < 0:
+            yield b""
+        else:
+            yield record[header_end + 1:].translate(None, b"\r\n")
+
+def parse_fastq(blocks: Iterable[bytes]) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Parses the records of a 4 lines FastQ content given by blocks of bytes.
+    Records may be split anywhere between two blocks.
+
+    Parameter:
+    blocks: The content of the file, by blocks
+
+    Returns:
+    An iterator of (sequence, quality), as bytes
+
+    Raises:
+    ValueError: if a record does not start with '@'
+
+    Examples:
+    >>> list(parse_fastq([b"@r1\\nACG\\n+\\nII", b"I\\n@r2\\nTT\\n+r2\\n#I\\n\\n"]))
+    [(b'ACG', b'III'), (b'TT', b'#I')]
+    """
+    lines = []
+    tail = b""
+    for block in blocks:
+        block_lines = (tail + block).split(b"\n")
+        tail = block_lines.pop()
+        lines.extend(block_lines)
+        complete = len(lines) - len(lines) % 4
+        yield from _fastq_records(lines, complete)
+        del lines[:complete]
+    lines.append(tail)
+    # Blank lines at the end of the file
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if len(lines) % 4:
+        raise ValueError("Truncated FastQ record at the end of the file")
+    yield from _fastq_records(lines, len(lines))
+
+def _fastq_records(lines: List[bytes], end: int) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Yields the (sequence, quality) of the records held by the end first lines.
+    """
+    for i in range(0, end, 4):
+        if not lines[i].startswith(b"@"):
+            raise ValueError(f"FastQ record must start with '@': {lines[i][:50]!r}")
+        yield lines[i + 1].rstrip(b"\r"), lines[i + 3].rstrip(b"\r")
+
+def _as_bytes(sequence: Union[str, bytes]) -> bytes:
+    """
+    Returns the bytes of a sequence given as str or bytes.
+    """
+    return sequence.encode() if isinstance(sequence, str) else sequence
+
 def kmers (sequence: str, k: int) -> Dict[str, int]:
     """
     Generates all kmers from a sequence and count their occurrences.
@@ -47,12 +584,561 @@ def kmers (sequence: str, k: int) -> Dict[str, int]:
     >>> kmers("ATG", 5)
     {}
     """
-    kmers = defaultdict(int)
-    # Browse every positions where kmers are possibles
-    for pos in range(len(sequence)-k+1):
-        # Add them to the dictionary with their number of occurrences
-        kmers[sequence[pos:pos+k]] += 1
-    return kmers
+    # Thin wrapper over the packed counter, kmers are only decoded at the end
+    return {decode(kmer, k): count for kmer, count in packed_kmers(sequence, k).items()}
+
+def encode(kmer: str) -> int:
+    """
+    Packs a nucleotidic sequence into an integer, using 2 bits per base.
+
+    Parameter:
+    kmer: A nucleotidic sequence (A, C, G, T only)
+
+    Returns:
+    The packed kmer
+
+    Raises:
+    ValueError: if the sequence contains another character than A, C, G or T
+
+    Examples:
+    >>> encode("ACGT")
+    27
+    >>> encode("TTT")
+    63
+    >>> encode("")
+    0
+    """
+    if not kmer:
+        return 0
+    return int(kmer.translate(_ENCODE_TABLE), 4)
+
+def decode(code: int, k: int) -> str:
+    """
+    Unpacks an integer produced by encode into its nucleotidic sequence.
+
+    Parameters:
+    code: The packed kmer
+    k: The length of the kmer
+
+    Returns:
+    The nucleotidic sequence
+
+    Examples:
+    >>> decode(27, 4)
+    'ACGT'
+    >>> decode(0, 3)
+    'AAA'
+    >>> decode(encode("GATTACA"), 7)
+    'GATTACA'
+    """
+    if k <= 0:
+        return ""
+    # Each hexadecimal digit holds 2 nucleotides
+    sequence = format(code, 'x').zfill((k + 1) // 2).translate(_DECODE_TABLE)
+    return sequence[len(sequence) - k:]
+
+def reverse_complement(code: int, k: int) -> int:
+    """
+    Returns the reverse complement of a packed kmer.
+
+    Parameters:
+    code: The packed kmer
+    k: The length of the kmer
+
+    Returns:
+    The packed reverse complement
+
+    Examples:
+    >>> decode(reverse_complement(encode("AACG"), 4), 4)
+    'CGTT'
+    >>> decode(reverse_complement(encode("ACGT"), 4), 4)
+    'ACGT'
+    """
+    return encode(decode(code, k).translate(_COMPLEMENT_TABLE)[::-1])
+
+def canonical(code: int, k: int) -> int:
+    """
+    Returns the canonical form of a packed kmer: the smallest between the kmer and
+    its reverse complement, so both strands of a kmer share the same key.
+
+    Parameters:
+    code: The packed kmer
+    k: The length of the kmer
+
+    Returns:
+    The packed canonical kmer
+
+    Examples:
+    >>> decode(canonical(encode("TTGC"), 4), 4)
+    'GCAA'
+    >>> decode(canonical(encode("GCAA"), 4), 4)
+    'GCAA'
+    """
+    return min(code, reverse_complement(code, k))
+
+def iter_kmers(sequence: Union[str, bytes], k: int, canonical: bool = False) -> Iterator[Tuple[int, int]]:
+    """
+    Yields every kmer of a sequence as a packed integer along with its position.
+    Each kmer is computed from the previous one by a shift of 2 bits (rolling fingerprint) instead
+    of slicing k nucleotides: for k <= 32 the kmer fits in a machine word and each position costs
+    O(1) word operations, beyond that the shift and mask work on a 2k bits integer, in O(k).
+    Kmers containing another character than A, C, G or T are skipped.
+
+    Parameters:
+    sequence: A nucleotidic sequence (str or bytes)
+    k: The size of the kmer
+    canonical: If True, the canonical form of each kmer is yielded
+
+    Returns:
+    An iterator of (position, packed kmer)
+
+    Examples:
+    >>> [(pos, decode(kmer, 3)) for pos, kmer in iter_kmers("ATCGG", 3)]
+    [(0, 'ATC'), (1, 'TCG'), (2, 'CGG')]
+    >>> [(pos, decode(kmer, 2)) for pos, kmer in iter_kmers("ACNGTA", 2)]
+    [(0, 'AC'), (3, 'GT'), (4, 'TA')]
+    >>> [(pos, decode(kmer, 2)) for pos, kmer in iter_kmers("ACTT", 2, canonical=True)]
+    [(0, 'AC'), (1, 'AG'), (2, 'AA')]
+    """
+    mask = (1 << 2 * k) - 1
+    shift = 2 * (k - 1)
+    code = reverse = 0
+    # Number of valid bases read since the last unknown nucleotide
+    length = 0
+    for pos, base in enumerate(_as_bytes(sequence)):
+        value = _BASE_CODES[base]
+        if value < 0:
+            code = reverse = length = 0
+            continue
+        # Shift the previous kmer by one base and append the new one
+        code = ((code << 2) | value) & mask
+        if canonical:
+            # The complement of the new base enters the reverse complement on the left
+            reverse = (reverse >> 2) | ((3 - value) << shift)
+        length += 1
+        if length >= k:
+            yield pos - k + 1, (reverse if canonical and reverse < code else code)
+
+def count_kmers(sequence: Union[str, bytes], k: int, kmers_dict: Dict[int, int], canonical: bool = False) -> Dict[int, int]:
+    """
+    Counts the packed kmers of a sequence directly into a shared dictionary.
+    Same extraction as iter_kmers, inlined to avoid the generator overhead.
+
+    Parameters:
+    sequence: A nucleotidic sequence (str or bytes)
+    k: The size of the kmer
+    kmers_dict: The dictionary of packed kmers and their counts to update
+    canonical: If True, each kmer is folded with its reverse complement (see canonical)
+
+    Returns:
+    The updated dictionary
+
+    Examples:
+    >>> table = {}
+    >>> count_kmers("AAAAAA", 2, table)
+    {0: 5}
+    >>> count_kmers("AAC", 2, table)
+    {0: 6, 1: 1}
+    >>> {decode(kmer, 2): count for kmer, count in count_kmers("AAACTT", 2, {}, canonical=True).items()}
+    {'AA': 3, 'AC': 1, 'AG': 1}
+    """
+    mask = (1 << 2 * k) - 1
+    code = 0
+    length = 0
+    if not canonical:
+        for base in _as_bytes(sequence):
+            value = _BASE_CODES[base]
+            if value < 0:
+                code = length = 0
+                continue
+            code = ((code << 2) | value) & mask
+            length += 1
+            if length >= k:
+                kmers_dict[code] = kmers_dict.get(code, 0) + 1
+        return kmers_dict
+
+    # The reverse complement is rolled along: the complement of the new base enters on the left
+    shift = 2 * (k - 1)
+    reverse = 0
+    for base in _as_bytes(sequence):
+        value = _BASE_CODES[base]
+        if value < 0:
+            code = reverse = length = 0
+            continue
+        code = ((code << 2) | value) & mask
+        reverse = (reverse >> 2) | ((3 - value) << shift)
+        length += 1
+        if length >= k:
+            key = code if code < reverse else reverse
+            kmers_dict[key] = kmers_dict.get(key, 0) + 1
+    return kmers_dict
+
+def packed_kmers(sequence: Union[str, bytes], k: int) -> Dict[int, int]:
+    """
+    Generates all kmers from a sequence as packed integers and count their occurrences.
+    Kmers containing another character than A, C, G or T are skipped.
+
+    Parameters:
+    sequence: A nucleotidic sequence (str or bytes)
+    k: The size of the kmer
+
+    Returns:
+    A dictionary of packed kmers and their counts
+
+    Examples:
+    >>> packed_kmers("ATCGGCAT", 3) == {encode(kmer): count for kmer, count in kmers("ATCGGCAT", 3).items()}
+    True
+    >>> packed_kmers("AAAAAA", 2)
+    {0: 5}
+    >>> packed_kmers("ACNGTA", 2)
+    {1: 1, 11: 1, 12: 1}
+    >>> packed_kmers("ATG", 5)
+    {}
+    """
+    return count_kmers(sequence, k, {})
+
+def count_kmers_bloom(sequence: Union[str, bytes], k: int, kmers_dict: Dict[int, int], bloom_filters: List[BloomFilter],
+                      canonical: bool = False) -> Dict[int, int]:
+    """
+    Counts the packed kmers of a sequence, sending them through a cascade of Bloom filters first:
+    a kmer only enters kmers_dict at its (len(bloom_filters) + 1)-th occurrence, with that count,
+    so kmers seen fewer times (mostly sequencing errors) never take room in the dictionary.
+
+    Parameters:
+    sequence: A nucleotidic sequence (str or bytes)
+    k: The size of the kmer
+    kmers_dict: The dictionary of packed kmers and their counts to update
+    bloom_filters: The cascade of Bloom filters (see BloomFilter.bloom_cascade)
+    canonical: If True, each kmer is folded with its reverse complement
+
+    Returns:
+    The updated dictionary
+
+    Examples:
+    >>> filters = bloom_cascade(3, 1024)
+    >>> table = count_kmers_bloom("ACGTACGTACGT", 4, {}, filters)
+    >>> {decode(kmer, 4): count for kmer, count in table.items()}
+    {'ACGT': 3}
+    >>> {decode(kmer, 4): count for kmer, count in count_kmers_bloom("ACGT", 4, table, filters).items()}
+    {'ACGT': 4}
+    """
+    first_count = len(bloom_filters) + 1
+    for _, kmer in iter_kmers(sequence, k, canonical):
+        if kmer in kmers_dict:
+            kmers_dict[kmer] += 1
+            continue
+        # The kmer goes down the cascade until a filter has not seen it yet
+        for bloom in bloom_filters:
+            if not bloom.add(kmer):
+                break
+        else:
+            kmers_dict[kmer] = first_count
+    return kmers_dict
+
+def count_reads_kmers(filename: str, k: int, threads: int = 1, batch_size: int = 1_000_000,
+                      canonical: bool = False, bloom_filters: Optional[List[BloomFilter]] = None,
+                      reads_hook: Optional[Callable[[Iterator[bytes]], Iterator[bytes]]] = None) -> Dict[int, int]:
+    """
+    Counts the packed kmers of every read of a file.
+
+    Parameters:
+    filename: The name of the reads file
+    k: The size of the kmer
+    threads: The number of counting processes (1: counted in the current process)
+    batch_size: The number of nucleotides sent to a counting process at once
+    canonical: If True, each kmer is folded with its reverse complement
+    bloom_filters: If given, kmers are counted through this cascade of Bloom filters (see count_kmers_bloom)
+    reads_hook: If given, the reads of the file go through this function (to measure their parsing)
+
+    Returns:
+    A dictionary of packed kmers and their counts
+
+    Raises:
+    ValueError: if Bloom filters are used with several processes
+    """
+    reads = read_gz(filename)
+    if reads_hook:
+        reads = reads_hook(reads)
+    if bloom_filters:
+        if threads > 1:
+            raise ValueError("Bloom filters counting can not be used with several processes")
+        kmers_dict = {}
+        for seq in reads:
+            count_kmers_bloom(seq, k, kmers_dict, bloom_filters, canonical)
+        return kmers_dict
+
+    if threads > 1:
+        return _count_reads_kmers_parallel(reads, k, threads, batch_size, canonical)
+
+    kmers_dict = {}
+    for seq in reads:
+        # Kmers are counted straight into the shared dictionary
+        count_kmers(seq, k, kmers_dict, canonical)
+    return kmers_dict
+
+def _read_batches(reads: Iterable[bytes], batch_size: int) -> Iterator[List[bytes]]:
+    """
+    Groups reads into batches of about batch_size nucleotides.
+    """
+    batch = []
+    size = 0
+    for seq in reads:
+        batch.append(seq)
+        size += len(batch[-1])
+        if size >= batch_size:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+def _count_worker(k: int, canonical: bool, worker_id: int, tasks, shard_queues, results) -> None:
+    """
+    Counting process: counts the kmers of the batches it receives, then merges the shard
+    it is responsible for (kmers whose hash modulo the number of workers is worker_id).
+    """
+    kmers_dict = {}
+    while True:
+        batch = tasks.get()
+        if batch is None:
+            break
+        for sequence in batch:
+            count_kmers(sequence, k, kmers_dict, canonical)
+
+    # Partition the local table by hash and send each shard to the worker owning it
+    workers = len(shard_queues)
+    shards = [{} for _ in range(workers)]
+    for kmer, count in kmers_dict.items():
+        shards[hash(kmer) % workers][kmer] = count
+    del kmers_dict
+    for i, shard in enumerate(shards):
+        if i != worker_id:
+            shard_queues[i].put(shard)
+    own_shard = shards[worker_id]
+    shards = None
+
+    # Merge the shards received from the other workers
+    for _ in range(workers - 1):
+        for kmer, count in shard_queues[worker_id].get().items():
+            own_shard[kmer] = own_shard.get(kmer, 0) + count
+    # The order of the shard depends on the batches the worker was given: it is sorted so that the
+    # table (whose order gives the node IDs of the graph, hence the contigs order) is the same at every run
+    results.put((worker_id, {kmer: own_shard[kmer] for kmer in sorted(own_shard)}))
+
+def _count_reads_kmers_parallel(reads: Iterable[bytes], k: int, threads: int, batch_size: int,
+                                canonical: bool) -> Dict[int, int]:
+    """
+    Counts the packed kmers of reads with several processes: the current process reads the file
+    and hands batches of reads to the workers, each worker counts them, then every worker merges
+    one hash partition of the table. The partitions are disjoint and gathered in one dictionary,
+    in the order of the workers, so that the table is the same at every run with the same number
+    of processes.
+
+    Raises:
+    RuntimeError: if a counting process stops with an error
+
+    Example:
+    >>> _count_reads_kmers_parallel([b"ACGTT", b"CGTTA"], 4, 2, 1, False) == count_kmers(b"CGTTA", 4, count_kmers(b"ACGTT", 4, {}))
+    True
+
+    # Un processus tué (par manque de mémoire, par exemple) arrête le comptage au lieu de le bloquer
+    >>> def reads():
+    ...     yield b"ACGTT"
+    ...     multiprocessing.active_children()[0].kill()
+    ...     yield from [b"CGTTA"] * 100
+    >>> _count_reads_kmers_parallel(reads(), 4, 2, 1, False)
+    Traceback (most recent call last):
+    ...
+    RuntimeError: A counting process stopped with exit code -9
+    >>> multiprocessing.active_children()
+    []
+    """
+    tasks = multiprocessing.Queue(maxsize=2 * threads)
+    shard_queues = [multiprocessing.Queue() for _ in range(threads)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_count_worker, args=(k, canonical, i, tasks, shard_queues, results))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for batch in _read_batches(reads, batch_size):
+            _put_checked(tasks, batch, workers)
+        for _ in workers:
+            _put_checked(tasks, None, workers)
+        shards = dict(_get_checked(results, workers) for _ in workers)
+    except BaseException:
+        # The workers would wait for their last batch (or for the shards of the other ones)
+        # forever: they are stopped, and the batches left in the queue are dropped
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+        tasks.cancel_join_thread()
+        raise
+
+    kmers_dict = {}
+    for worker_id in range(threads):
+        kmers_dict.update(shards.pop(worker_id))
+    for worker in workers:
+        worker.join()
+    return kmers_dict
+
+def _check_workers(workers: List[multiprocessing.Process]) -> None:
+    """
+    Raises a RuntimeError if one of the counting processes stopped with an error (an exception,
+    or killed by the system when out of memory).
+    """
+    for worker in workers:
+        if worker.exitcode not in (None, 0):
+            raise RuntimeError(f"A counting process stopped with exit code {worker.exitcode}")
+
+def _put_checked(tasks, item, workers: List[multiprocessing.Process]) -> None:
+    """
+    Puts an item in a bounded queue of the counting processes, checking that they are still
+    running while the queue is full (a stopped worker would never free its place).
+    """
+    while True:
+        try:
+            tasks.put(item, timeout=_WORKERS_POLL)
+            return
+        except queue.Full:
+            _check_workers(workers)
+
+def _get_checked(results, workers: List[multiprocessing.Process]):
+    """
+    Gets an item from a queue filled by the counting processes, checking that they are still
+    running while it is empty (a stopped worker would never send its result).
+    """
+    while True:
+        try:
+            return results.get(timeout=_WORKERS_POLL)
+        except queue.Empty:
+            _check_workers(workers)
+
+def iter_super_kmers(sequence: Union[str, bytes], k: int, m: int, canonical: bool = False) -> Iterator[Tuple[int, bytes]]:
+    """
+    Splits a sequence into super-kmers: maximal substrings whose kmers all share the same minimizer
+    (the smallest mmer of size m, in a hashed order). Every kmer of the sequence belongs to
+    exactly one super-kmer, so all the occurrences of a kmer go with the same minimizer.
+
+    Parameters:
+    sequence: A nucleotidic sequence
+    k: The size of the kmer
+    m: The size of the minimizers (m <= k)
+    canonical: If True, canonical mmers are used so both strands of a kmer share their minimizer
+
+    Returns:
+    An iterator of (minimizer, super-kmer)
+
+    Examples:
+    >>> sequence = "ACGTTGCATGTCGCATGATGCATGCANNAGCTAGCTAGGCT"
+    >>> super_kmers = [super_kmer for _, super_kmer in iter_super_kmers(sequence, 8, 3)]
+    >>> sorted(kmer for s in super_kmers for kmer in kmers(s, 8)) == sorted(kmers(sequence, 8))
+    True
+    >>> sum(len(s) - 7 for s in super_kmers) == sum(kmers(sequence, 8).values())
+    True
+    >>> list(iter_super_kmers("ACG", 8, 3))
+    []
+    """
+    window = k - m + 1
+    for fragment in _ACGT_FRAGMENTS.findall(_as_bytes(sequence)):
+        if len(fragment) < k:
+            continue
+        mmers = [(mmer * _MINIMIZER_MULTIPLIER) & _MASK_64 for _, mmer in iter_kmers(fragment, m, canonical)]
+        # Positions of the candidate minimizers of the current window, by increasing value
+        candidates = deque()
+        start = 0
+        current = None
+        for j, value in enumerate(mmers):
+            while candidates and mmers[candidates[-1]] >= value:
+                candidates.pop()
+            candidates.append(j)
+            # Position of the kmer whose last mmer is j
+            i = j - window + 1
+            if i < 0:
+                continue
+            if candidates[0] < i:
+                candidates.popleft()
+            minimizer = mmers[candidates[0]]
+            if current is None:
+                current = minimizer
+            elif minimizer != current:
+                # The super-kmer holds the kmers start to i - 1
+                yield current, fragment[start:i - 1 + k]
+                start = i
+                current = minimizer
+        yield current, fragment[start:]
+
+def _estimate_partitions(filename: str, k: int, max_memory: int) -> int:
+    """
+    Estimates the number of buckets needed for the count of a bucket to fit in max_memory bytes,
+    assuming every kmer is distinct (about 4 nucleotides per byte of a gz file).
+    """
+    bases = os.path.getsize(filename) * (4 if filename.endswith(".gz") else 1)
+    # Dictionary slot, integer key and count of a packed kmer
+    entry_size = 100 + 4 * (2 * k // 30 + 1)
+    partitions = -(-bases * entry_size // max_memory)
+    return min(max(partitions, 1), _MAX_PARTITIONS)
+
+def count_reads_kmers_disk(filename: str, k: int, max_memory: int, threshold: int = 1, canonical: bool = False,
+                           minimizer_size: int = 15, partitions: Optional[int] = None, tmp_dir: Optional[str] = None,
+                           reads_hook: Optional[Callable[[Iterator[bytes]], Iterator[bytes]]] = None) -> Dict[int, int]:
+    """
+    Counts and filters the packed kmers of a file out of core, in 2 passes:
+    - the reads are split into super-kmers written in temporary bucket files, according to their minimizer
+    - each bucket is counted in memory, filtered, and its kmers are added to the result
+    Every occurrence of a kmer goes to the same bucket, so the counts are identical to the in-memory count
+    filtered by kmers_filter, while the counting memory is bounded by the size of one bucket.
+
+    Parameters:
+    filename: The name of the reads file
+    k: The size of the kmer
+    max_memory: The memory (in bytes) allowed to count one bucket
+    threshold: The minimum count to keep a kmer
+    canonical: If True, each kmer is folded with its reverse complement
+    minimizer_size: The size of the minimizers
+    partitions: The number of buckets (estimated from the file size and max_memory if not given)
+    tmp_dir: The directory of the bucket files (system default if not given)
+    reads_hook: If given, the reads of the file go through this function (to measure their parsing)
+
+    Returns:
+    A filtered dictionary of packed kmers and their counts
+    """
+    if partitions is None:
+        partitions = _estimate_partitions(filename, k, max_memory)
+    m = min(minimizer_size, k)
+
+    reads = read_gz(filename)
+    if reads_hook:
+        reads = reads_hook(reads)
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        paths = [os.path.join(directory, f"bucket_{i}.txt") for i in range(partitions)]
+
+        # Pass 1 : super-kmers are written in the bucket of their minimizer
+        buckets = [open(path, "wb") for path in paths]
+        try:
+            for seq in reads:
+                for minimizer, super_kmer in iter_super_kmers(seq, k, m, canonical):
+                    buckets[minimizer % partitions].write(super_kmer + b"\n")
+        finally:
+            for bucket in buckets:
+                bucket.close()
+
+        # Pass 2 : each bucket is counted on its own
+        kmers_dict = {}
+        for path in paths:
+            bucket_dict = {}
+            with open(path, "rb") as bucket:
+                for super_kmer in bucket:
+                    # The line break resets the kmer, no need to strip it
+                    count_kmers(super_kmer, k, bucket_dict, canonical)
+            os.remove(path)
+            for kmer, count in bucket_dict.items():
+                if count >= threshold:
+                    kmers_dict[kmer] = count
+            del bucket_dict
+    return kmers_dict
 
 def check_kmers(kmer: str,dict_kmers: Dict[str, int]) -> bool:
      """
@@ -93,7 +1179,7 @@ def kmers_filter (kmers_dict: Dict[str, int], threshold: int= 1) -> Dict[str, in
     >>> kmers_filter({'A': 2, 'T': 3}, 3)
     {'T': 3}
     """
-    f_kmers = defaultdict(int)
+    f_kmers = {}
     for kmer, count in kmers_dict.items():
         if count >= threshold:
             f_kmers[kmer] = count
@@ -107,6 +1193,9 @@ def abundance_hist(kmers_dict: Dict[str, int]) -> None:
     Parameter:
     kmer_dict: The dictionary of kmers and their counts
     """
+    # Optional dependency, only needed to draw the histogram
+    from matplotlib import pyplot as plt
+
     abundance_hist = defaultdict(int)
     for count in kmers_dict.values():
             abundance_hist[count] += 1
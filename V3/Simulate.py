@@ -0,0 +1,238 @@
+# Simulation of reads sets for scaling and stress tests
+import argparse
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Import needed functions to file reading and writing
+from Script import FASTQ_EXTENSIONS, NUCLEOTIDES, read_gz, write_fasta, write_fastq
+
+_ASCII = np.frombuffer(NUCLEOTIDES.encode(), dtype=np.uint8)
+# Code of each byte of a genome, -1 for the characters other than A, C, G and T
+_CODES = np.full(256, -1, dtype=np.int8)
+for _code, _base in enumerate(NUCLEOTIDES):
+    _CODES[ord(_base)] = _CODES[ord(_base.lower())] = _code
+# Number of bases of the reads simulated at once
+_BATCH_BASES = 1 << 22
+# Qualities of the correct and of the substituted bases in FastQ files
+_GOOD_QUALITY = ord("I")
+_ERROR_QUALITY = ord("#")
+
+
+def _generator(seed: int, stream: int) -> np.random.Generator:
+    """
+    Returns the random generator of one stream (genome, haplotype, reads...) of a seed, so that
+    changing a setting of a stream does not change the other ones.
+    """
+    return np.random.default_rng([seed, stream])
+
+
+def random_genome(size: int, seed: int = 0, repeat_copies: int = 0, repeat_length: int = 1000) -> str:
+    """
+    Generates a random genome, with copies of a repeat at random positions.
+
+    Parameters:
+    size: The size of the genome
+    seed: The seed of the random generator (the same seed gives the same genome)
+    repeat_copies: The number of copies of the repeat (none if lower than 2)
+    repeat_length: The size of the repeat
+
+    Returns:
+    The sequence of the genome
+
+    Examples:
+    >>> random_genome(20, seed=1) == random_genome(20, seed=1), len(random_genome(20, seed=1))
+    (True, 20)
+    >>> genome = random_genome(5000, repeat_copies=3, repeat_length=100)
+    >>> sum(genome.count(genome[i:i + 100]) for i in range(0, 4900)) >= 3 * 100
+    True
+    """
+    rng = _generator(seed, 0)
+    codes = rng.integers(0, 4, size, dtype=np.uint8)
+    if repeat_copies >= 2:
+        if repeat_copies * repeat_length > size:
+            raise ValueError("The repeat copies do not fit in the genome")
+        repeat = rng.integers(0, 4, repeat_length, dtype=np.uint8)
+        # Copies are put in distinct slots, so that they do not overlap
+        slots = np.sort(rng.choice(size // repeat_length, repeat_copies, replace=False))
+        for slot in slots.tolist():
+            codes[slot * repeat_length:(slot + 1) * repeat_length] = repeat
+    return _ASCII[codes].tobytes().decode()
+
+
+def _encode_genome(genome: str, rng: np.random.Generator) -> np.ndarray:
+    """
+    Returns the codes of the bases of a genome, the other characters (N...) being replaced by
+    random bases.
+    """
+    codes = _CODES[np.frombuffer(genome.encode(), dtype=np.uint8)]
+    unknown = codes < 0
+    codes[unknown] = rng.integers(0, 4, int(unknown.sum()))
+    return codes.astype(np.uint8)
+
+
+def simulate_reads(genome: str, coverage: float, read_length: int, error_rate: float = 0.0,
+                   snp_rate: float = 0.0, circular: bool = False, both_strands: bool = False,
+                   seed: int = 0) -> Iterator[Tuple[str, str]]:
+    """
+    Draws reads uniformly from a genome, with substitution errors.
+
+    Parameters:
+    genome: The sequence of the genome
+    coverage: The mean number of reads covering each base
+    read_length: The length of the reads
+    error_rate: The probability of each base of a read to be substituted by another base
+    snp_rate: The fraction of the bases differing on a second haplotype (each SNP makes a bubble
+              in the graph), the reads being drawn from both haplotypes
+    circular: If True, the genome is circular and reads may overlap its end and its start
+    both_strands: If True, half of the reads are drawn from the reverse complement strand
+    seed: The seed of the random generator (the same seed gives the same reads)
+
+    Returns:
+    An iterator of (sequence, quality) couples, the quality of substituted bases being '#'
+    and the other ones 'I'
+
+    Raises:
+    ValueError: if the reads are longer than a linear genome
+
+    Examples:
+    >>> genome = random_genome(1000, seed=3)
+    >>> reads = list(simulate_reads(genome, 10, 100, seed=3))
+    >>> len(reads), all(sequence in genome for sequence, _ in reads)
+    (100, True)
+    >>> reads = list(simulate_reads(genome, 10, 100, error_rate=0.05, seed=3))
+    >>> 400 < sum(quality.count("#") for _, quality in reads) < 600
+    True
+    >>> list(simulate_reads("ACGT", 2, 3, circular=True, seed=1))
+    [('CGT', 'III'), ('ACG', 'III'), ('TAC', 'III')]
+    """
+    size = len(genome)
+    if not circular and read_length > size:
+        raise ValueError("The reads are longer than the genome")
+    haplotypes = [_encode_genome(genome, _generator(seed, 1))]
+    if snp_rate > 0:
+        rng = _generator(seed, 2)
+        haplotype = haplotypes[0].copy()
+        snps = np.unique(rng.integers(0, size, rng.binomial(size, snp_rate)))
+        haplotype[snps] = (haplotype[snps] + rng.integers(1, 4, len(snps), dtype=np.uint8)) % 4
+        haplotypes.append(haplotype)
+    if circular:
+        # The start of the genome is appended to its end, so that every read is a plain slice
+        haplotypes = [np.concatenate([haplotype, np.resize(haplotype, read_length - 1)])
+                      for haplotype in haplotypes]
+
+    rng = _generator(seed, 3)
+    reads = int(np.ceil(coverage * size / read_length))
+    batch = max(1, _BATCH_BASES // read_length)
+    offsets = np.arange(read_length)
+    for first in range(0, reads, batch):
+        count = min(batch, reads - first)
+        starts = rng.integers(0, size if circular else size - read_length + 1, count)
+        sources = rng.integers(0, len(haplotypes), count)
+        codes = np.empty((count, read_length), dtype=np.uint8)
+        for index, haplotype in enumerate(haplotypes):
+            rows = np.flatnonzero(sources == index)
+            codes[rows] = haplotype[starts[rows, None] + offsets]
+
+        qualities = np.full((count, read_length), _GOOD_QUALITY, dtype=np.uint8)
+        if error_rate > 0:
+            errors = np.unique(rng.integers(0, codes.size, rng.binomial(codes.size, error_rate)))
+            flat = codes.reshape(-1)
+            flat[errors] = (flat[errors] + rng.integers(1, 4, len(errors), dtype=np.uint8)) % 4
+            qualities.reshape(-1)[errors] = _ERROR_QUALITY
+        if both_strands:
+            reverse = rng.random(count) < 0.5
+            codes[reverse] = 3 - codes[reverse, ::-1]
+            qualities[reverse] = qualities[reverse, ::-1]
+
+        sequences, qualities = _ASCII[codes].tobytes(), qualities.tobytes()
+        for row in range(count):
+            start = row * read_length
+            yield (sequences[start:start + read_length].decode(),
+                   qualities[start:start + read_length].decode())
+
+
+def write_reads(filename: str, reads: Iterator[Tuple[str, str]], threads: Optional[int] = None) -> int:
+    """
+    Writes reads in a Fasta or FastQ file (according to its extension), compressed in BGZF if it
+    ends with .gz. Reads are named by their index, as in the LevelN.fa.gz files.
+
+    Parameters:
+    filename: The name of the file to write
+    reads: An iterable of (sequence, quality) couples
+    threads: The number of threads compressing the file
+
+    Returns:
+    The number of written reads
+    """
+    if filename.endswith(FASTQ_EXTENSIONS):
+        return write_fastq(filename, ((str(index), sequence, quality)
+                                      for index, (sequence, quality) in enumerate(reads)), threads)
+    # Reads are written on a single line
+    return write_fasta(filename, ((str(index), sequence) for index, (sequence, _) in enumerate(reads)),
+                       threads, line_width=1 << 62)
+
+
+def read_genome(filename: str) -> List[str]:
+    """
+    Reads the sequences of a genome from a Fasta file (its chromosomes).
+    """
+    return [sequence.decode() for sequence in read_gz(filename)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--outfile", required=True, type=str,
+                        help="Reads file to write: Fasta (.fa, .fasta) or FastQ (.fq, .fastq), compressed if it ends with .gz")
+    parser.add_argument("-g", "--genome", required=False, type=str,
+                        help="Fasta file of the genome to draw the reads from (default: a random genome)")
+    parser.add_argument("-s", "--genome_size", required=False, type=int, default=30_000,
+                        help="Size of the random genome (default: 30000)")
+    parser.add_argument("-R", "--reference", required=False, type=str,
+                        help="Also write the genome in this Fasta file (reference for QUAST)")
+    parser.add_argument("-c", "--coverage", required=False, type=float, default=50,
+                        help="Mean number of reads covering each base (default: 50)")
+    parser.add_argument("-l", "--read_length", required=False, type=int, default=20_000,
+                        help="Length of the reads (default: 20000)")
+    parser.add_argument("-e", "--error_rate", required=False, type=float, default=0.0,
+                        help="Probability of substitution of each base of the reads (default: 0)")
+    parser.add_argument("--snp_rate", required=False, type=float, default=0.0,
+                        help="Fraction of the bases differing on a second haplotype, making bubbles (default: 0)")
+    parser.add_argument("--repeat_copies", required=False, type=int, default=0,
+                        help="Number of copies of a repeat inserted in the random genome (default: 0)")
+    parser.add_argument("--repeat_length", required=False, type=int, default=1000,
+                        help="Length of the repeat (default: 1000)")
+    parser.add_argument("--circular", required=False, action='store_true',
+                        help="The genome is circular: reads may overlap its end and its start")
+    parser.add_argument("--both_strands", required=False, action='store_true',
+                        help="Draw half of the reads from the reverse complement strand")
+    parser.add_argument("--seed", required=False, type=int, default=0,
+                        help="Seed of the random generators (default: 0)")
+    parser.add_argument("-t", "--threads", required=False, type=int,
+                        help="Number of threads compressing the files (default: number of CPUs)")
+
+    args = parser.parse_args()
+
+    for value, option in ((args.genome_size, "-s"), (args.coverage, "-c"), (args.read_length, "-l")):
+        if value <= 0:
+            raise ValueError(f" La valeur de {option} doit être strictement positive.")
+    for rate, option in ((args.error_rate, "-e"), (args.snp_rate, "--snp_rate")):
+        if not 0 <= rate <= 1:
+            raise ValueError(f" Le taux {option} doit être compris entre 0 et 1.")
+
+    if args.genome:
+        chromosomes = read_genome(args.genome)
+    else:
+        chromosomes = [random_genome(args.genome_size, args.seed, args.repeat_copies, args.repeat_length)]
+    if args.reference:
+        write_fasta(args.reference, ((f"chromosome_{index}", sequence) for index, sequence in enumerate(chromosomes)),
+                    args.threads)
+        print(f"{args.reference} was generated")
+
+    # Each chromosome is given its own seed, so that its reads do not depend on the other ones
+    reads = (read for index, chromosome in enumerate(chromosomes)
+             for read in simulate_reads(chromosome, args.coverage, args.read_length, args.error_rate,
+                                        args.snp_rate, args.circular, args.both_strands, args.seed + index))
+    count = write_reads(args.outfile, reads, args.threads)
+    print(f"{count} reads generated")
+    print(f"{args.outfile} was generated")
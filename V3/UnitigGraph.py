@@ -0,0 +1,381 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from Instrument import RunReport
+from Script import decode, encode, reverse_complement, write_fasta
+
+
+class UnitigGraph:
+
+    def __init__(self, k: int, canonical: bool = False):
+        """
+        Compacted de Bruijn graph: each maximal non-branching path of (k-1)-mers is stored once,
+        as a unitig, and the unitigs are linked by the kmers joining their ends. It is built
+        from a graph of (k-1)-mers by DBG.compact.
+
+        Parameters:
+        k: The size of the kmers
+        canonical: If True, the graph contains both strands and each contig is only written once
+
+        Example:
+        >>> g = UnitigGraph(3)
+        >>> g.add_unitig(encode('ATGG'), 4, 2, 6)
+        0
+        >>> g.add_unitig(encode('GA'), 2, 0, 0)
+        1
+        >>> g.add_edge(0, 1, 1)
+        >>> len(g), g.get_graph()
+        (2, {'ATGG': ['GA'], 'GA': []})
+        """
+        self.__k = k
+        self.__canonical = canonical
+        # Per unitig: packed sequence (None once removed), length, number of kmers and sum of their counts
+        self.__sequences: List[Optional[int]] = []
+        self.__lengths: List[int] = []
+        self.__kmers: List[int] = []
+        self.__abundances: List[int] = []
+        # Links between unitigs, with the count of the kmer joining them
+        self.__successors: List[Dict[int, int]] = []
+        self.__predecessors: List[Dict[int, int]] = []
+
+    def add_unitig(self, sequence: int, length: int, kmers: int, abundance: int) -> int:
+        """
+        Adds a unitig to the graph.
+
+        Parameters:
+        sequence: The packed sequence of the unitig
+        length: The length of the sequence
+        kmers: The number of kmers inside the unitig
+        abundance: The sum of the counts of these kmers
+
+        Returns:
+        The index of the unitig
+        """
+        self.__sequences.append(sequence)
+        self.__lengths.append(length)
+        self.__kmers.append(kmers)
+        self.__abundances.append(abundance)
+        self.__successors.append({})
+        self.__predecessors.append({})
+        return len(self.__sequences) - 1
+
+    def add_edge(self, source: int, target: int, count: int) -> None:
+        """
+        Links the end of a unitig to the start of another one.
+
+        Parameters:
+        source: The index of the first unitig
+        target: The index of the second unitig
+        count: The count of the kmer joining them
+        """
+        self.__successors[source][target] = count
+        self.__predecessors[target][source] = count
+
+    def __len__(self) -> int:
+        return sum(sequence is not None for sequence in self.__sequences)
+
+    def __alive(self) -> List[int]:
+        """
+        Returns the indexes of the unitigs not removed.
+        """
+        return [unitig for unitig, sequence in enumerate(self.__sequences) if sequence is not None]
+
+    def __nodes(self, unitig: int) -> int:
+        """
+        Returns the number of (k-1)-mers of a unitig.
+        """
+        return self.__lengths[unitig] - self.__k + 2
+
+    def __mean_abundance(self, unitig: int) -> float:
+        """
+        Returns the mean count of the kmers inside a unitig (0 if it is a single (k-1)-mer).
+        """
+        return self.__abundances[unitig] / self.__kmers[unitig] if self.__kmers[unitig] else 0.0
+
+    def __decode(self, unitig: int) -> str:
+        return decode(self.__sequences[unitig], self.__lengths[unitig])
+
+    # Get methods
+
+    def get_unitigs(self) -> List[Tuple[str, int, float]]:
+        """
+        Returns the unitigs of the graph.
+
+        Returns:
+        A list of (sequence, length, mean abundance) tuples
+
+        Example:
+        >>> from DBG import DBG
+        >>> g = DBG({'ATG':2, 'TGG':4, 'GGA':1, 'TGT':1}).compact()
+        >>> g.get_unitigs()
+        [('ATG', 3, 2.0), ('GGA', 3, 1.0), ('GT', 2, 0.0)]
+        """
+        return [(self.__decode(unitig), self.__lengths[unitig], self.__mean_abundance(unitig))
+                for unitig in self.__alive()]
+
+    def get_graph(self) -> Dict[str, List[str]]:
+        """
+        Returns the links between unitigs.
+
+        Returns:
+        A dictionary where keys are unitigs sequences and values are lists of the following unitigs
+
+        Example:
+        >>> from DBG import DBG
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1}).compact()
+        >>> g.get_graph()
+        {'ATG': ['GGA', 'GT'], 'GGA': [], 'GT': []}
+        """
+        return {self.__decode(unitig): [self.__decode(successor) for successor in self.__successors[unitig]]
+                for unitig in self.__alive()}
+
+    # Graph edition
+
+    def __remove_unitig(self, unitig: int) -> None:
+        """
+        Removes a unitig and its links.
+        """
+        for successor in list(self.__successors[unitig]):
+            self.__predecessors[successor].pop(unitig, None)
+        for predecessor in list(self.__predecessors[unitig]):
+            self.__successors[predecessor].pop(unitig, None)
+        self.__successors[unitig] = {}
+        self.__predecessors[unitig] = {}
+        self.__sequences[unitig] = None
+
+    def __remove_edge(self, source: int, target: int) -> None:
+        self.__successors[source].pop(target, None)
+        self.__predecessors[target].pop(source, None)
+
+    def __merge_chains(self) -> None:
+        """
+        Merges the unitigs left linked by a single edge after a removal, so that each unitig is a
+        maximal non-branching path again.
+        """
+        for unitig in self.__alive():
+            if self.__sequences[unitig] is None:
+                continue
+            while len(self.__successors[unitig]) == 1:
+                successor, count = next(iter(self.__successors[unitig].items()))
+                if successor == unitig or len(self.__predecessors[successor]) != 1:
+                    break
+                self.__absorb(unitig, successor, count)
+
+    def __absorb(self, unitig: int, successor: int, count: int) -> None:
+        """
+        Appends a successor (its only predecessor being unitig) to a unitig.
+        """
+        # The first (k-1)-mer of the successor overlaps the last one of the unitig by k-2 bases
+        suffix = self.__lengths[successor] - self.__k + 2
+        self.__sequences[unitig] = ((self.__sequences[unitig] << 2 * suffix)
+                                    | (self.__sequences[successor] & ((1 << 2 * suffix) - 1)))
+        self.__lengths[unitig] += suffix
+        self.__kmers[unitig] += self.__kmers[successor] + 1
+        self.__abundances[unitig] += self.__abundances[successor] + count
+
+        self.__successors[unitig] = self.__successors[successor]
+        for target, target_count in self.__successors[unitig].items():
+            del self.__predecessors[target][successor]
+            self.__predecessors[target][unitig] = target_count
+        self.__successors[successor] = {}
+        self.__predecessors[successor] = {}
+        self.__sequences[successor] = None
+
+    # Assembly options
+
+    def __is_tip(self, unitig: int, threshold: int) -> bool:
+        """
+        Checks if a unitig is a tip: shorter than threshold (k-1)-mers, dead-end on one side and
+        hanging on the other side from unitigs which have another way to go.
+        """
+        if self.__nodes(unitig) >= threshold:
+            return False
+        successors, predecessors = self.__successors[unitig], self.__predecessors[unitig]
+        if not successors:
+            return all(len(self.__successors[predecessor]) > 1 for predecessor in predecessors)
+        if not predecessors:
+            return all(len(self.__predecessors[successor]) > 1 for successor in successors)
+        return False
+
+    def remove_tips(self, threshold: int = 5) -> int:
+        """
+        Removes the tips of the graph (see DBG.is_tip), on both ends of the branching points.
+
+        Parameter:
+        threshold: The maximum number of (k-1)-mers of a tip
+
+        Returns:
+        The number of removed tips
+
+        Example:
+        >>> from DBG import DBG
+        >>> g = DBG({'ATG':1, 'TGG':1, 'GGA':1, 'TGT':1}).compact()
+        >>> g.remove_tips(2)
+        1
+        >>> g.get_graph()
+        {'ATGGA': []}
+        """
+        tips = [unitig for unitig in self.__alive() if self.__is_tip(unitig, threshold)]
+        for unitig in tips:
+            self.__remove_unitig(unitig)
+        self.__merge_chains()
+        return len(tips)
+
+    def __branch_score(self, source: int, branch: Optional[int], target: int) -> Tuple[float, int]:
+        """
+        Returns the mean abundance of the kmers of a bubble branch (including the kmers linking it
+        to the bubble ends), and its canonical sequence to break ties the same way on both strands.
+        A branch None is a direct link from source to target.
+        """
+        if branch is None:
+            return float(self.__successors[source][target]), -1
+        count = self.__successors[source][branch] + self.__abundances[branch] + self.__successors[branch][target]
+        sequence = self.__sequences[branch]
+        return (count / (self.__kmers[branch] + 2),
+                min(sequence, reverse_complement(sequence, self.__lengths[branch])))
+
+    def remove_bubbles(self) -> int:
+        """
+        Detects the bubbles (branches leaving a unitig and joining the same unitig) and only keeps
+        their most abundant branch.
+
+        Returns:
+        The number of removed branches
+
+        Example:
+        >>> kmers_bulle = {'ATG':1, 'TGC':1, 'GCA':3, 'CAA':3, 'GCT':1, 'CTA':1, 'TAA':1}
+        >>> from DBG import DBG
+        >>> g = DBG(kmers_bulle).compact()
+        >>> g.get_graph()
+        {'ATGC': ['CA', 'CTA'], 'CA': ['AA'], 'CTA': ['AA'], 'AA': []}
+        >>> g.remove_bubbles()
+        1
+        >>> g.get_unitigs()
+        [('ATGCAA', 6, 2.0)]
+        """
+        removed = 0
+        for source in self.__alive():
+            if self.__sequences[source] is None or len(self.__successors[source]) < 2:
+                continue
+            # Branches of a single unitig, grouped by the unitig they join
+            targets: Dict[int, List[Optional[int]]] = {}
+            for branch in self.__successors[source]:
+                if (branch != source and len(self.__predecessors[branch]) == 1
+                        and len(self.__successors[branch]) == 1):
+                    target = next(iter(self.__successors[branch]))
+                    if target != branch:
+                        targets.setdefault(target, []).append(branch)
+            for target, branches in targets.items():
+                if target in self.__successors[source]:
+                    branches.append(None)
+                if len(branches) < 2:
+                    continue
+                kept = max(branches, key=lambda branch: self.__branch_score(source, branch, target))
+                for branch in branches:
+                    if branch == kept:
+                        continue
+                    if branch is None:
+                        self.__remove_edge(source, target)
+                    else:
+                        self.__remove_unitig(branch)
+                    removed += 1
+        self.__merge_chains()
+        return removed
+
+    # Sequence Assembly
+
+    def get_all_contigs(self, output_file: str = "output_file.fa", tip_threshold=3,
+                        threads: Optional[int] = None, report: Optional[RunReport] = None) -> None:
+        """
+        Removes the tips and the bubbles, then writes each unitig as a contig in a fasta file.
+
+        Parameters:
+        output_file: Path to the output fasta file, compressed in BGZF if it ends with .gz
+        tip_threshold: The threshold for tip removal
+        threads: The number of threads compressing the output file (see Script.write_fasta)
+        report: If given, the tips and bubbles removals and the writing are measured in it
+        """
+        report = report or RunReport(enabled=False)
+        with report.stage("tips") as counts:
+            counts["tips"] = self.remove_tips(tip_threshold)
+        with report.stage("bubbles") as counts:
+            counts["bubbles"] = self.remove_bubbles()
+
+        with report.stage("write") as counts:
+            records = report.iterate("extract", self.__records(), within="write", items="contigs")
+            contig_num = write_fasta(output_file, report.contigs(records, counts), threads)
+            counts["contigs"] = contig_num
+
+        print(f"Contigs générés : {contig_num}")
+        print(f"{output_file} was generated\n")
+
+    def __is_circle(self, unitig: int) -> bool:
+        """
+        Checks if a unitig is an isolated cycle (a circular chromosome), linked only to itself.
+        """
+        return list(self.__successors[unitig]) == [unitig] and list(self.__predecessors[unitig]) == [unitig]
+
+    def __twins(self) -> Dict[int, int]:
+        """
+        Pairs each unitig of a canonical graph with its reverse complement unitig (itself for a
+        palindrome). The reverse complement of a unitig starts with the reverse complement of its
+        last (k-1)-mer, except for the circular unitigs: both strands of a cycle start at unrelated
+        rotations, so this (k-1)-mer is searched in the other circular unitigs of the same length.
+
+        Examples:
+        >>> from DBG import DBG
+        >>> g = DBG({'AATG':1, 'ATGC':1}, canonical=True).compact()
+        >>> g.get_unitigs()
+        [('AATGC', 5, 1.0), ('GCATT', 5, 1.0)]
+        >>> g._UnitigGraph__twins()
+        {0: 1, 1: 0}
+
+        #Cas circulaire : les deux brins ne commencent pas au même endroit
+        >>> from Script import kmers
+        >>> g = DBG({kmer: 1 for kmer in kmers('AACAGTCAAC', 4)}, canonical=True).compact()
+        >>> g.get_unitigs()
+        [('AACAGTCAA', 9, 1.0), ('TGTTGACTG', 9, 1.0)]
+        >>> g._UnitigGraph__twins()
+        {0: 1, 1: 0}
+        """
+        node_mask = (1 << 2 * (self.__k - 1)) - 1
+        first_nodes = {}
+        circles: Dict[int, List[int]] = {}
+        for unitig in self.__alive():
+            if self.__is_circle(unitig):
+                circles.setdefault(self.__lengths[unitig], []).append(unitig)
+            else:
+                first_nodes[self.__sequences[unitig] >> 2 * (self.__lengths[unitig] - self.__k + 1)] = unitig
+
+        twins = {}
+        for unitig in first_nodes.values():
+            last_node = reverse_complement(self.__sequences[unitig] & node_mask, self.__k - 1)
+            twins[unitig] = first_nodes.get(last_node, unitig)
+        for group in circles.values():
+            for unitig in group:
+                if unitig in twins:
+                    continue
+                node = decode(reverse_complement(self.__sequences[unitig] & node_mask, self.__k - 1), self.__k - 1)
+                # The sequence of a circular unitig ends with its first k-2 bases: it holds all its (k-1)-mers
+                twin = next((other for other in group if other not in twins and node in self.__decode(other)),
+                            unitig)
+                twins[unitig] = twin
+                twins[twin] = unitig
+        return twins
+
+    def __records(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields the (name, sequence) of the contigs, one per unitig (one per pair of reverse
+        complementary unitigs if the graph is canonical: the one with the smallest sequence).
+        """
+        twins = self.__twins() if self.__canonical else {}
+        contig_num = 1
+        for unitig in self.__alive():
+            sequence = self.__sequences[unitig]
+            twin = twins.get(unitig, unitig)
+            if (self.__sequences[twin], twin) < (sequence, unitig):
+                # The other strand of this unitig is written instead
+                continue
+
+            contig = self.__decode(unitig)
+            yield f"contig_{contig_num}_len_{len(contig)}", contig
+            contig_num += 1